@@ -1,21 +1,26 @@
 import os
-import shutil
+from src.db_versions import current_path, open_client
+from src.index_bundle import INSTALLED_MANIFEST_FILENAME
 
 # The path to your ChromaDB database directory
 DB_PATH = "chroma_db"
 
 def clear_database():
     """
-    Deletes the ChromaDB database directory to clear all stored data.
+    Deletes every collection in the ChromaDB database to clear all stored data.
+    Collections are dropped through the client rather than by deleting the
+    directory, so clients that other parts of the app already hold stay valid.
     """
     if os.path.exists(DB_PATH):
-        print(f"Found database at '{DB_PATH}'. Deleting...")
-        try:
-            shutil.rmtree(DB_PATH)
-            print("Database cleared successfully.")
-        except OSError as e:
-            print(f"Error: {e.filename} - {e.strerror}.")
-            print("Please ensure no other processes are using the database and try again.")
+        print(f"Found database at '{DB_PATH}'. Deleting all collections...")
+        client, _ = open_client(DB_PATH)
+        for collection in client.list_collections():
+            client.delete_collection(name=collection.name)
+        # The database no longer holds the contents of an imported bundle
+        manifest_path = os.path.join(current_path(DB_PATH), INSTALLED_MANIFEST_FILENAME)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        print("Database cleared successfully.")
     else:
         print("Database not found. Nothing to clear.")
 
@@ -25,4 +30,4 @@ if __name__ == "__main__":
     if confirm.lower() == 'y':
         clear_database()
     else:
-        print("Operation cancelled.")
\ No newline at end of file
+        print("Operation cancelled.")
@@ -1,6 +1,6 @@
 import os
-import shutil
-from src.ingestion_pipeline import IngestionPipeline, get_db_collection, CHROMA_DB_PATH
+from src.ingestion_pipeline import IngestionPipeline, get_shard_router
+from clear_database import clear_database
 
 TEST_DATA_DIR = "data"
 TEST_FILES = {
@@ -14,9 +14,7 @@ def run_ingestion_test():
     """
     Cleans up old database, runs ingestion on test files, and verifies the result.
     """
-    if os.path.exists(CHROMA_DB_PATH):
-        print(f"Removing old database at {CHROMA_DB_PATH}...")
-        shutil.rmtree(CHROMA_DB_PATH)
+    clear_database()
 
     pipeline = IngestionPipeline()
 
@@ -27,13 +25,13 @@ def run_ingestion_test():
             print(f"Warning: Test file not found at {file_path}. Skipping.")
             
     try:
-        collection = get_db_collection()
-        count = collection.count()
+        router = get_shard_router()
+        count = router.count()
         print(f"\nVerification: Found {count} documents in the database.")
         
-        if count > 0:
-            print("\nPeeking at one of the stored documents:")
-            print(collection.peek(limit=1))
+        for shard in router.list_shards():
+            print(f"\nShard '{shard.name}' holds {shard.count()} chunks. Peeking at one of them:")
+            print(shard.peek(limit=1))
     except Exception as e:
         print(f"Could not verify database contents: {e}")
 
@@ -1,5 +1,6 @@
 # notebooks/04_test_rag_chain.py
 from src.rag_pipeline import RAGPipeline
+from src.conversation_state import ConversationState
 
 def run_rag_test():
     """
@@ -7,7 +8,7 @@ def run_rag_test():
     """
     # 1. Create an instance of the pipeline
     rag_pipe = RAGPipeline()
-    chat_history = []
+    conversation = ConversationState()
 
     
     # 2. Define a test query.
@@ -43,16 +44,17 @@ def run_rag_test():
     print("="*50)
     query1 = "Which customer had the oldest subscription?" #<-- CHANGE
     print(f"\n--- Turn 1 Query: '{query1}' ---")
-    answer1, sources1, next_steps1 = rag_pipe.generate_answer(query1, chat_history)
+    answer1, sources1, next_steps1 = rag_pipe.generate_answer(query1, conversation)
     print("\nAnswer:", answer1)
     print("\nSources:", {meta['source'] for meta in sources1})
     print("\nNext Steps:", next_steps1)
-    chat_history.append((query1, answer1)) # Add to history
+    # The turn is recorded in the conversation state by generate_answer
 
     # --- TURN 2 (Follow-up) ---
     query2 = "In which country do they live?" #<-- CHANGE
     print(f"\n--- Turn 2 Query (with history): '{query2}' ---")
-    answer2, sources2, next_steps2 = rag_pipe.generate_answer(query2, chat_history)
+    answer2, sources2, next_steps2 = rag_pipe.generate_answer(query2, conversation)
+    print("\nStandalone query:", conversation.last_turn.standalone_query)
     print("\nAnswer:", answer2)
     print("\nSources:", {meta['source'] for meta in sources2})
 
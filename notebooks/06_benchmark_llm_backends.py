@@ -0,0 +1,73 @@
+import time
+from src.llm_backends import create_llm_backend, load_llm_config
+
+# This script compares CPU generation speed (tokens/s) of the LLM backends.
+# Each variant is applied on top of llm_config.json / LLM_* environment variables.
+MAX_NEW_TOKENS = 128
+RUNS = 3
+
+VARIANTS = {
+    "ctransformers": {"backend": "ctransformers", "gpu_layers": 0},
+    "llama_cpp": {"backend": "llama_cpp", "gpu_layers": 0},
+    "llama_cpp + prompt lookup": {"backend": "llama_cpp", "gpu_layers": 0, "draft_mode": "prompt_lookup"},
+    # Speculative decoding with a small draft model; both models must share a vocabulary
+    # "llama_cpp + TinyLlama draft": {
+    #     "backend": "llama_cpp",
+    #     "gpu_layers": 0,
+    #     "model_path": "models/llama-2-7b-chat.Q4_K_M.gguf",
+    #     "draft_mode": "model",
+    #     "draft_model_path": "models/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf",
+    # },
+}
+
+PROMPT = """
+### Instruction:
+Use the following context to answer the question.
+
+### Context:
+Row 1: Customer is Alice, Country is Panama, Subscription Date is 2020-01-14.
+Row 2: Customer is Bob, Country is Chile, Subscription Date is 2021-06-02.
+Row 3: Customer is Carol, Country is Peru, Subscription Date is 2019-11-23.
+
+### User's Question:
+List every customer with their country and subscription date.
+
+### Answer:
+"""
+
+def run_benchmark():
+    results = {}
+    for name, overrides in VARIANTS.items():
+        print(f"\n--- {name} ---")
+        try:
+            config = load_llm_config(overrides)
+            start = time.perf_counter()
+            llm = create_llm_backend(config)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"Skipping: {e}")
+            continue
+
+        prompt_tokens = llm.count_tokens(PROMPT)
+        llm(PROMPT, max_new_tokens=8)  # Warm-up
+
+        total_tokens = 0
+        total_seconds = 0.0
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            output = llm(PROMPT, max_new_tokens=MAX_NEW_TOKENS)
+            total_seconds += time.perf_counter() - start
+            total_tokens += llm.count_tokens(output)
+
+        results[name] = total_tokens / total_seconds
+        print(f"Load: {load_seconds:.1f}s, prompt: {prompt_tokens} tokens, threads: {config['threads']}")
+        print(f"Generated {total_tokens} tokens in {total_seconds:.1f}s -> {results[name]:.1f} tokens/s")
+        del llm
+
+    print("\n" + "="*50)
+    for name, tokens_per_second in sorted(results.items(), key=lambda item: -item[1]):
+        print(f"{name:<35} {tokens_per_second:8.1f} tokens/s")
+    print("="*50)
+
+if __name__ == "__main__":
+    run_benchmark()
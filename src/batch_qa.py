@@ -0,0 +1,359 @@
+"""
+Headless question answering over the RAG pipeline.
+
+Run a JSONL file of questions:
+    python -m src.batch_qa run questions.jsonl -o answers.jsonl --workers 2
+
+Serve a small local HTTP API:
+    python -m src.batch_qa serve --port 8765
+
+Each input line is either a JSON object with a "question" (and optional "id",
+"tenant" and "group", which restrict retrieval to that tenant's or group's
+shards) or a plain JSON string. Results are written as JSONL in completion order, with
+per-item timings; a question that fails produces an {"id", "question", "error"}
+line instead of an answer.
+"""
+import argparse
+import contextlib
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .rag_pipeline import RAGPipeline
+
+# --- CONFIGURATION ---
+DEFAULT_WORKERS = 1
+# None uses the calibrated top_k from index_config.json
+DEFAULT_TOP_K = None
+RETRIEVAL_BATCH_SIZE = 32
+RETRIEVAL_BATCH_WINDOW_SECONDS = 0.02
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class BatchScheduler:
+    """
+    Schedules question answering in two stages.
+
+    A single retrieval thread collects pending questions (up to
+    RETRIEVAL_BATCH_SIZE, waiting at most RETRIEVAL_BATCH_WINDOW_SECONDS for
+    more to arrive) and embeds and retrieves them in one batch. The retrieved
+    contexts are then handed to `num_workers` generation threads, each of which
+    owns its own RAGPipeline and therefore its own LLM instance.
+
+    `tenant` and `group` are the defaults for questions that do not name one.
+    """
+
+    def __init__(self, num_workers: int = DEFAULT_WORKERS, top_k: int = DEFAULT_TOP_K,
+                 include_next_steps: bool = False, tenant: str = None, group: str = None):
+        self.num_workers = num_workers
+        self.top_k = top_k
+        self.include_next_steps = include_next_steps
+        self.tenant = tenant
+        self.group = group
+        self._retrieval_pipeline = None
+        self._retrieval_queue = queue.Queue()
+        self._generation_queue = queue.Queue()
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            pipelines = [RAGPipeline() for _ in range(self.num_workers)]
+            # The first pipeline also serves retrieval; load it before any worker starts
+            pipelines[0]._initialize()
+            self._retrieval_pipeline = pipelines[0]
+
+            self._threads.append(threading.Thread(
+                target=self._retrieval_loop, args=(pipelines[0],), name="batch-qa-retrieval", daemon=True
+            ))
+            for i, pipeline in enumerate(pipelines):
+                self._threads.append(threading.Thread(
+                    target=self._generation_loop, args=(pipeline,), name=f"batch-qa-worker-{i}", daemon=True
+                ))
+            for thread in self._threads:
+                thread.start()
+            self._started = True
+
+    def shard_names_for(self, tenant: str = None, group: str = None):
+        """The shards to search for a tenant or group, falling back to the scheduler's defaults."""
+        self.start()
+        return self._retrieval_pipeline.shard_names_for(tenant=tenant or self.tenant, group=group or self.group)
+
+    def submit(self, question: str, item_id=None, shard_names: list = None) -> Future:
+        """
+        Queues a question and returns a Future that resolves to its result dict.
+        `shard_names` restricts retrieval to some shards (see shard_names_for).
+        """
+        self.start()
+        future = Future()
+        self._retrieval_queue.put((item_id, question, shard_names, time.perf_counter(), future))
+        return future
+
+    def map(self, items):
+        """
+        Answers (item_id, question, tenant, group) items (see read_questions),
+        yielding result dicts as they complete. A question that fails yields an
+        {"id", "question", "error"} record instead, so one failure does not
+        abort the rest of the batch.
+        """
+        futures = {
+            self.submit(question, item_id, self.shard_names_for(tenant, group)): (item_id, question)
+            for item_id, question, tenant, group in items
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                item_id, question = futures[future]
+                yield {"id": item_id, "question": question, "error": str(e)}
+
+    def _retrieval_loop(self, pipeline: RAGPipeline):
+        while True:
+            batch = [self._retrieval_queue.get()]
+            deadline = time.perf_counter() + RETRIEVAL_BATCH_WINDOW_SECONDS
+            while len(batch) < RETRIEVAL_BATCH_SIZE:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._retrieval_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Questions for the same shards share one retrieval call
+            by_shards = {}
+            for item in batch:
+                shard_names = item[2]
+                by_shards.setdefault(tuple(shard_names) if shard_names is not None else None, []).append(item)
+
+            for shard_names, items in by_shards.items():
+                retrieval_start = time.perf_counter()
+                try:
+                    contexts = pipeline.retrieve_chunks_batch(
+                        [item[1] for item in items], top_k=self.top_k,
+                        shard_names=list(shard_names) if shard_names is not None else None
+                    )
+                except Exception as e:
+                    for item in items:
+                        item[4].set_exception(e)
+                    continue
+                retrieval_seconds = time.perf_counter() - retrieval_start
+
+                for item, (docs, metadatas) in zip(items, contexts):
+                    self._generation_queue.put((item, docs, metadatas, retrieval_seconds, len(items)))
+
+    def _generation_loop(self, pipeline: RAGPipeline):
+        while True:
+            (item_id, question, _, submitted_at, future), docs, metadatas, retrieval_seconds, batch_size = \
+                self._generation_queue.get()
+            generation_start = time.perf_counter()
+            try:
+                answer, sources, next_steps = pipeline.generate_from_context(
+                    question, docs, metadatas, include_next_steps=self.include_next_steps
+                )
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            finished_at = time.perf_counter()
+
+            future.set_result({
+                "id": item_id,
+                "question": question,
+                "answer": answer,
+                "sources": sorted({meta.get("source", "N/A") for meta in sources}),
+                "next_steps": next_steps,
+                "timings": {
+                    "queue_seconds": round(generation_start - submitted_at - retrieval_seconds, 4),
+                    "retrieval_seconds": round(retrieval_seconds, 4),
+                    "retrieval_batch_size": batch_size,
+                    "generation_seconds": round(finished_at - generation_start, 4),
+                    "total_seconds": round(finished_at - submitted_at, 4),
+                },
+            })
+
+
+def read_questions(lines):
+    """
+    Parses JSONL question lines into (item_id, question, tenant, group) items.
+    Blank lines are skipped.
+    """
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            items.append((line_number, record, None, None))
+        elif isinstance(record, dict) and isinstance(record.get("question"), str):
+            items.append((record.get("id", line_number), record["question"], record.get("tenant"), record.get("group")))
+        else:
+            raise ValueError(f"Line {line_number} must be a JSON string or an object with a \"question\".")
+    return items
+
+
+def run_batch(input_path: str, output_path: str = None, num_workers: int = DEFAULT_WORKERS,
+              top_k: int = DEFAULT_TOP_K, include_next_steps: bool = False, tenant: str = None, group: str = None):
+    """
+    Answers every question in a JSONL file and streams the results as JSONL.
+    `tenant` and `group` apply to questions that do not name their own.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        items = read_questions(f)
+    print(f"Loaded {len(items)} questions from {input_path}.", file=sys.stderr)
+
+    scheduler = BatchScheduler(num_workers=num_workers, top_k=top_k, include_next_steps=include_next_steps,
+                               tenant=tenant, group=group)
+    out = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+    start = time.perf_counter()
+    failed = 0
+    try:
+        # Pipeline progress messages go to stderr so stdout stays valid JSONL
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in scheduler.map(items):
+                if "error" in result:
+                    failed += 1
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if output_path:
+            out.close()
+    print(f"Answered {len(items) - failed} questions in {time.perf_counter() - start:.1f}s "
+          f"({failed} failed).", file=sys.stderr)
+
+
+class BatchQARequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /query  with {"question": "...", "id": ..., "tenant": ...} returns one JSON result.
+    POST /batch  with a JSONL body streams JSONL results as they complete.
+    Invalid requests get a 400, failed answers a 500 (or an error line in /batch).
+    GET  /health returns {"status": "ok"}.
+    """
+
+    # Chunked transfer encoding for /batch needs HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    scheduler = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if self.path == "/query":
+                items = read_questions([body])
+            elif self.path == "/batch":
+                items = read_questions(body.splitlines())
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+                return
+            if not items:
+                raise ValueError("No question given.")
+        except ValueError as e:
+            # Also covers invalid JSON, UTF-8 and Content-Length values
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        if self.path == "/batch":
+            self._stream_jsonl(self.scheduler.map(items))
+            return
+        item_id, question, tenant, group = items[0]
+        try:
+            result = self.scheduler.submit(question, item_id, self.scheduler.shard_names_for(tenant, group)).result()
+        except Exception as e:
+            self._send_json(500, {"id": item_id, "question": question, "error": str(e)})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_jsonl(self, results):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for result in results:
+                self._write_chunk(result)
+        except ConnectionError:
+            # The client went away; there is nobody left to report to
+            return
+        except Exception as e:
+            # The status line is already sent; report the failure in-stream and end it cleanly
+            self._write_chunk({"error": f"Batch failed: {e}"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, num_workers: int = DEFAULT_WORKERS,
+          top_k: int = DEFAULT_TOP_K, include_next_steps: bool = False, tenant: str = None, group: str = None):
+    """Starts the local HTTP service. Concurrent requests share one scheduler."""
+    BatchQARequestHandler.scheduler = BatchScheduler(
+        num_workers=num_workers, top_k=top_k, include_next_steps=include_next_steps, tenant=tenant, group=group
+    )
+    BatchQARequestHandler.scheduler.start()
+    server = ThreadingHTTPServer((host, port), BatchQARequestHandler)
+    print(f"Serving batch QA on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.", file=sys.stderr)
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless question answering over the indexed documents.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common_arguments(subparser):
+        subparser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                               help="Number of LLM instances generating answers in parallel.")
+        subparser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                               help="Number of chunks retrieved per question (defaults to index_config.json).")
+        subparser.add_argument("--next-steps", action="store_true",
+                               help="Also generate follow-up question suggestions.")
+        subparser.add_argument("--tenant", help="Only search this tenant's shard (SHARD_STRATEGY=tenant).")
+        subparser.add_argument("--group", help="Only search this document group's shard (SHARD_STRATEGY=group).")
+
+    run_parser = subparsers.add_parser("run", help="Answer a JSONL file of questions.")
+    run_parser.add_argument("input", help="Path to a JSONL file of questions.")
+    run_parser.add_argument("-o", "--output", help="Output JSONL path (defaults to stdout).")
+    add_common_arguments(run_parser)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the local HTTP API.")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_common_arguments(serve_parser)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run_batch(args.input, args.output, num_workers=args.workers, top_k=args.top_k,
+                  include_next_steps=args.next_steps, tenant=args.tenant, group=args.group)
+    else:
+        serve(args.host, args.port, num_workers=args.workers, top_k=args.top_k,
+              include_next_steps=args.next_steps, tenant=args.tenant, group=args.group)
+
+
+if __name__ == "__main__":
+    main()
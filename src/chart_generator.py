@@ -1,8 +1,33 @@
+import io
 import json
 import re
-import matplotlib.pyplot as plt
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
-import streamlit as st
+
+# --- CONFIGURATION ---
+CHART_CACHE_SIZE = 128
+RENDER_WORKERS = 2
+MAX_LINE_POINTS = 500
+MAX_BARS = 30
+MAX_PIE_SLICES = 10
+OTHER_LABEL = "Other"
+FIGURE_SIZE = (10, 6)
+FIGURE_DPI = 100
+
+# Applied once; figures below are created through the object-oriented API, never pyplot
+sns.set_theme(style="whitegrid")
+
+_render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="chart-render")
+# (image_bytes, error) per normalized spec; render errors are cached too, so a broken chart is not retried
+_cache = OrderedDict()
+# Renders started by request_chart that have not finished yet
+_pending = {}
+_cache_lock = threading.Lock()
+
 
 def is_json(text):
     """Checks if a string is a valid JSON object, possibly enclosed in markdown."""
@@ -10,7 +35,7 @@ def is_json(text):
     match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
     if match:
         return True, match.group(1)
-    
+
     # Fallback for raw JSON
     try:
         json.loads(text)
@@ -18,49 +43,183 @@ def is_json(text):
     except ValueError:
         return False, None
 
-@st.cache_data
-def create_chart(chart_data_str: str):
+
+def normalize_chart_spec(chart_data: dict) -> dict:
+    """
+    Reduces the model's chart JSON to the fields that affect the image, with
+    numeric y values and x/y of equal length. Raises ValueError if incomplete.
+    """
+    if not isinstance(chart_data, dict):
+        raise ValueError("Error: Chart data must be a JSON object.")
+    chart_type = str(chart_data.get("chart_type", "")).strip().lower()
+    x_axis = chart_data.get("x_axis", {}) or {}
+    y_axis = chart_data.get("y_axis", {}) or {}
+    x_data = x_axis.get("data", []) or []
+    y_data = y_axis.get("data", []) or []
+
+    if not all([chart_type, x_data, y_data]):
+        raise ValueError("Error: Incomplete chart data provided in JSON.")
+    if chart_type not in ("bar", "line", "pie"):
+        raise ValueError(f"Error: Unsupported chart type '{chart_type}'.")
+    try:
+        y_data = [float(y) for y in y_data]
+    except (TypeError, ValueError):
+        raise ValueError("Error: The chart's y-axis data must be numeric.")
+
+    length = min(len(x_data), len(y_data))
+    return {
+        "chart_type": chart_type,
+        "title": str(chart_data.get("title", "Chart")),
+        "x_label": str(x_axis.get("label", "X-Axis")),
+        "y_label": str(y_axis.get("label", "Y-Axis")),
+        "x_data": [str(x) for x in x_data[:length]],
+        "y_data": y_data[:length],
+    }
+
+
+def _aggregate_categories(x_data: list, y_data: list, max_items: int):
+    """Keeps the largest max_items - 1 categories (in original order) and sums the rest into 'Other'."""
+    if len(x_data) <= max_items:
+        return x_data, y_data
+    keep = set(sorted(range(len(y_data)), key=lambda i: y_data[i], reverse=True)[:max_items - 1])
+    x_kept = [x for i, x in enumerate(x_data) if i in keep]
+    y_kept = [y for i, y in enumerate(y_data) if i in keep]
+    return x_kept + [OTHER_LABEL], y_kept + [sum(y for i, y in enumerate(y_data) if i not in keep)]
+
+
+def _downsample_series(x_data: list, y_data: list, max_points: int):
     """
-    Parses the JSON string and creates a Matplotlib chart.
-    Returns the figure object for display in Streamlit.
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last point
+    and, per bucket, the point that best preserves the shape of the line.
     """
+    n = len(y_data)
+    if n <= max_points:
+        return x_data, y_data
+
+    selected = [0]
+    bucket_size = (n - 2) / (max_points - 2)
+    for bucket in range(max_points - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        next_x = (next_start + next_end - 1) / 2
+        next_y = sum(y_data[next_start:next_end]) / max(next_end - next_start, 1)
+
+        prev = selected[-1]
+        best = max(
+            range(start, end),
+            key=lambda i: abs((prev - next_x) * (y_data[i] - y_data[prev]) - (prev - i) * (next_y - y_data[prev]))
+        )
+        selected.append(best)
+    selected.append(n - 1)
+    return [x_data[i] for i in selected], [y_data[i] for i in selected]
+
+
+def _render(spec: dict, image_format: str) -> bytes:
+    x_data, y_data = spec["x_data"], spec["y_data"]
+    if spec["chart_type"] == "line":
+        x_data, y_data = _downsample_series(x_data, y_data, MAX_LINE_POINTS)
+    elif spec["chart_type"] == "bar":
+        x_data, y_data = _aggregate_categories(x_data, y_data, MAX_BARS)
+    else:
+        x_data, y_data = _aggregate_categories(x_data, y_data, MAX_PIE_SLICES)
+
+    fig = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     try:
-        chart_data = json.loads(chart_data_str)
-
-        chart_type = chart_data.get("chart_type")
-        title = chart_data.get("title", "Chart")
-        x_label = chart_data.get("x_axis", {}).get("label", "X-Axis")
-        y_label = chart_data.get("y_axis", {}).get("label", "Y-Axis")
-        x_data = chart_data.get("x_axis", {}).get("data", [])
-        y_data = chart_data.get("y_axis", {}).get("data", [])
-
-        if not all([chart_type, x_data, y_data]):
-            return None, "Error: Incomplete chart data provided in JSON."
-
-        # Create the plot
-        sns.set_theme(style="whitegrid")
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        if chart_type == "bar":
-            sns.barplot(x=x_data, y=y_data, ax=ax, palette="viridis")
-        elif chart_type == "line":
-            sns.lineplot(x=x_data, y=y_data, ax=ax, marker='o', color='b')
-        elif chart_type == "pie":
+        # Plot against positions so repeated category labels are not merged
+        positions = range(len(x_data))
+        if spec["chart_type"] == "bar":
+            ax.bar(positions, y_data, color=sns.color_palette("viridis", len(x_data)))
+            ax.set_xticks(positions)
+            ax.set_xticklabels(x_data)
+        elif spec["chart_type"] == "line":
+            ax.plot(positions, y_data, marker='o' if len(x_data) <= 50 else None, color='b')
+            # Label at most ~20 ticks on long series
+            step = max(len(x_data) // 20, 1)
+            ax.set_xticks(positions[::step])
+            ax.set_xticklabels(x_data[::step])
+        else:
             # Pie charts don't have x/y axes in the same way
             ax.pie(y_data, labels=x_data, autopct='%1.1f%%', startangle=90, colors=sns.color_palette("pastel"))
             ax.axis('equal') # Equal aspect ratio ensures that pie is drawn as a circle.
-        else:
-            return None, f"Error: Unsupported chart type '{chart_type}'."
 
-        ax.set_title(title, fontsize=16)
-        ax.set_xlabel(x_label, fontsize=12)
-        ax.set_ylabel(y_label, fontsize=12)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        
-        return fig, None
+        ax.set_title(spec["title"], fontsize=16)
+        ax.set_xlabel(spec["x_label"], fontsize=12)
+        ax.set_ylabel(spec["y_label"], fontsize=12)
+        for label in ax.get_xticklabels():
+            label.set_rotation(45)
+            label.set_horizontalalignment("right")
+        fig.tight_layout()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=image_format)
+        return buffer.getvalue()
+    finally:
+        # Figures outside pyplot are not tracked globally; clearing releases the artists right away
+        fig.clear()
 
+
+def _parse(chart_data_str: str, image_format: str):
+    """Returns (spec, cache_key, error) for a chart JSON string."""
+    try:
+        spec = normalize_chart_spec(json.loads(chart_data_str))
     except json.JSONDecodeError:
-        return None, "Error: Invalid JSON format received from the model."
+        return None, None, "Error: Invalid JSON format received from the model."
+    except ValueError as e:
+        return None, None, str(e)
+    return spec, (json.dumps(spec, sort_keys=True), image_format), None
+
+
+def _cached(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+
+def _render_and_cache(spec: dict, key, image_format: str):
+    try:
+        result = _render(spec, image_format), None
     except Exception as e:
-        return None, f"An error occurred while generating the chart: {e}"
\ No newline at end of file
+        result = None, f"An error occurred while generating the chart: {e}"
+
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        _pending.pop(key, None)
+        while len(_cache) > CHART_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def render_chart(chart_data_str: str, image_format: str = "png"):
+    """
+    Parses the chart JSON and renders it to PNG or SVG bytes.
+    Results are cached by the normalized chart spec. Returns (image_bytes, error).
+    """
+    spec, key, error = _parse(chart_data_str, image_format)
+    if error:
+        return None, error
+    return _cached(key) or _render_and_cache(spec, key, image_format)
+
+
+def request_chart(chart_data_str: str, image_format: str = "png"):
+    """
+    Non-blocking render_chart: returns (image_bytes, error) if the chart is
+    cached or cannot be parsed, and otherwise starts rendering it on the
+    background render pool (once) and returns None. Call again, e.g. on a
+    later rerun, to pick up the result.
+    """
+    spec, key, error = _parse(chart_data_str, image_format)
+    if error:
+        return None, error
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+        if key not in _pending:
+            _pending[key] = _render_executor.submit(_render_and_cache, spec, key, image_format)
+    return None
@@ -0,0 +1,288 @@
+import os
+from dataclasses import dataclass, field
+from transformers import AutoTokenizer
+from .document_parser import load_document_blocks
+
+# --- CONFIGURATION ---
+EMBEDDING_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+# all-MiniLM-L6-v2 truncates its input at 256 tokens (including the two special tokens)
+CHUNK_SIZE_TOKENS = 250
+CHUNK_OVERLAP_TOKENS = 25
+TABLE_COLUMN_SEPARATOR = " | "
+SECTION_SEPARATOR = " > "
+
+
+@dataclass
+class Chunk:
+    """A piece of a document ready for embedding, with format-specific metadata."""
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+class Chunker:
+    """
+    Splits documents into chunks measured in embedding-model tokens.
+
+    Each file format has its own strategy:
+    - DOCX: paragraphs are packed within their heading section, and every
+      chunk starts with the section path. Tables are split like CSV files.
+    - PDF: text blocks are packed in reading order and keep their page range.
+    - CSV: rows are packed into groups that each start with the header row.
+      Tables too wide for that are first split into column groups, each
+      repeating only its own header cells.
+    - TXT: paragraphs are packed in order.
+
+    Units (paragraphs, blocks, rows) are never cut unless a single unit is
+    longer than the chunk size. Consecutive chunks share up to `chunk_overlap`
+    tokens of whole units.
+    """
+
+    def __init__(self, tokenizer_name: str = EMBEDDING_TOKENIZER, chunk_size: int = CHUNK_SIZE_TOKENS,
+                 chunk_overlap: int = CHUNK_OVERLAP_TOKENS):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size.")
+        self.tokenizer_name = tokenizer_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.tokenizer = None
+        self.strategies = {
+            '.docx': self._chunk_docx,
+            '.pdf': self._chunk_pdf,
+            '.csv': self._chunk_csv,
+            '.txt': self._chunk_text,
+        }
+
+    def _initialize(self):
+        if self.tokenizer is None:
+            self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            # We only count tokens here; silence the "sequence too long" warning
+            self.tokenizer.model_max_length = int(1e9)
+
+    def count_tokens(self, texts: list) -> list:
+        """Returns the number of embedding-model tokens of each text."""
+        self._initialize()
+        if not texts:
+            return []
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)['input_ids']]
+
+    def chunk_file(self, file_path: str) -> list:
+        """Parses a file into structural blocks and chunks it with the strategy for its format."""
+        return self.chunk_blocks(file_path, load_document_blocks(file_path))
+
+    def chunk_blocks(self, file_path: str, blocks: list) -> list:
+        """Chunks already-parsed blocks with the strategy for the file's format."""
+        _, extension = os.path.splitext(file_path)
+        if extension not in self.strategies:
+            raise ValueError(f"Unsupported file type: {extension}")
+        if not blocks:
+            return []
+        return self.strategies[extension](blocks)
+
+    # --- Strategies ---
+
+    def _chunk_text(self, blocks: list) -> list:
+        units = self._split_long_units([block['text'] for block in blocks], self.chunk_size)
+        return [Chunk("\n\n".join(group)) for group in self._pack(units, self.chunk_size)]
+
+    def _chunk_pdf(self, blocks: list) -> list:
+        texts, pages = [], []
+        for block in blocks:
+            for piece in self._split_long_units([block['text']], self.chunk_size):
+                texts.append(piece)
+                pages.append(block['page'])
+
+        chunks = []
+        for start, end in self._pack_ranges(self.count_tokens(texts), self.chunk_size):
+            chunks.append(Chunk(
+                "\n\n".join(texts[start:end]),
+                {'page_start': pages[start], 'page_end': pages[end - 1]}
+            ))
+        return chunks
+
+    def _chunk_docx(self, blocks: list) -> list:
+        chunks = []
+        headings = []
+        paragraphs = []
+
+        def flush_paragraphs():
+            if paragraphs:
+                chunks.extend(self._chunk_section(headings, paragraphs))
+                paragraphs.clear()
+
+        for block in blocks:
+            if block['kind'] == 'heading':
+                flush_paragraphs()
+                headings = [h for h in headings if h['level'] < block['level']] + [block]
+            elif block['kind'] == 'table':
+                flush_paragraphs()
+                chunks.extend(self._chunk_table(
+                    block['header'], block['rows'], prefix=self._section_prefix(headings)
+                ))
+            else:
+                paragraphs.append(block['text'])
+        flush_paragraphs()
+        return chunks
+
+    def _chunk_csv(self, blocks: list) -> list:
+        chunks = []
+        for block in blocks:
+            chunks.extend(self._chunk_table(block['header'], block['rows']))
+        return chunks
+
+    # --- Helpers ---
+
+    @staticmethod
+    def _section_prefix(headings: list) -> str:
+        return SECTION_SEPARATOR.join(h['text'] for h in headings)
+
+    def _chunk_section(self, headings: list, paragraphs: list) -> list:
+        prefix = self._section_prefix(headings)
+        # A very long heading path must not starve the content
+        lead = self._truncate(prefix, self.chunk_size // 2)
+        budget = self._remaining_budget(lead)
+        units = self._split_long_units(paragraphs, budget)
+        metadata = {'section': prefix} if prefix else {}
+        return [
+            Chunk("\n".join(([lead] if lead else []) + group), dict(metadata))
+            for group in self._pack(units, budget)
+        ]
+
+    def _chunk_table(self, header: list, rows: list, prefix: str = "") -> list:
+        """
+        Packs table rows into groups that each repeat the header line (and
+        section prefix). Wide tables are split into column groups first, so
+        that the repeated lead plus a row always fits in the chunk size.
+        """
+        # DOCX rows can have more cells than the header row
+        width = max([len(header)] + [len(row) for row in rows])
+        header = list(header) + [""] * (width - len(header))
+        # A long heading path must leave room for the header cells
+        lead_prefix = self._truncate(prefix, self.chunk_size // 4)
+        column_groups = self._column_groups(header, rows, lead_prefix)
+        chunks = []
+        for columns in column_groups:
+            header_text = TABLE_COLUMN_SEPARATOR.join(header[c] for c in columns)
+            lead = f"{lead_prefix}\n{header_text}" if lead_prefix else header_text
+            # A lead never takes more than half a chunk, so rows are never left without room
+            lead = self._truncate(lead, self.chunk_size // 2)
+            base_metadata = {'section': prefix} if prefix else {}
+            if len(column_groups) > 1:
+                base_metadata.update({'column_start': columns[0] + 1, 'column_end': columns[-1] + 1})
+            if not rows:
+                chunks.append(Chunk(lead, base_metadata))
+                continue
+
+            budget = self._remaining_budget(lead)
+            units, row_numbers = [], []
+            for row_number, row in enumerate(rows, start=1):
+                row_text = TABLE_COLUMN_SEPARATOR.join(row[c] for c in columns if c < len(row))
+                for piece in self._split_long_units([row_text], budget):
+                    units.append(piece)
+                    row_numbers.append(row_number)
+
+            for start, end in self._pack_ranges(self.count_tokens(units), budget):
+                metadata = {'row_start': row_numbers[start], 'row_end': row_numbers[end - 1], **base_metadata}
+                chunks.append(Chunk("\n".join([lead] + units[start:end]), metadata))
+        return chunks
+
+    def _column_groups(self, header: list, rows: list, prefix: str = "") -> list:
+        """
+        Splits the column indices into consecutive groups whose lead (prefix and
+        header cells) takes at most half a chunk and whose lead plus widest row
+        fits in a chunk. Each group has at least one column; a single cell that
+        is still too long is cut by _split_long_units.
+        """
+        separator_tokens = 1
+        prefix_tokens = self.count_tokens([prefix])[0] + separator_tokens if prefix else 0
+        header_tokens = self.count_tokens(list(header))
+        cell_tokens = [self.count_tokens([row[c] if c < len(row) else "" for row in rows]) for c in range(len(header))]
+
+        groups = []
+        columns = []
+        lead_cost = prefix_tokens
+        row_costs = [0] * len(rows)
+        for c in range(len(header)):
+            sep = separator_tokens if columns else 0
+            new_lead = lead_cost + header_tokens[c] + sep
+            new_rows = [cost + cell_tokens[c][r] + sep for r, cost in enumerate(row_costs)]
+            fits = new_lead <= self.chunk_size // 2 and new_lead + 1 + max(new_rows, default=0) <= self.chunk_size
+            if columns and not fits:
+                groups.append(columns)
+                columns = []
+                new_lead = prefix_tokens + header_tokens[c]
+                new_rows = [cell_tokens[c][r] for r in range(len(rows))]
+            columns.append(c)
+            lead_cost, row_costs = new_lead, new_rows
+        if columns:
+            groups.append(columns)
+        return groups
+
+    def _remaining_budget(self, lead: str) -> int:
+        """
+        Tokens left for content after a repeated lead (heading path / table
+        header). Callers cut leads to half a chunk first (see _truncate).
+        """
+        if not lead:
+            return self.chunk_size
+        return self.chunk_size - self.count_tokens([lead])[0] - 1
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cuts a text down to its first `max_tokens` tokens."""
+        if not text or self.count_tokens([text])[0] <= max_tokens:
+            return text
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        return text[:offsets[max_tokens - 1][1]].rstrip()
+
+    def _split_long_units(self, texts: list, budget: int) -> list:
+        """Cuts any text longer than `budget` tokens into overlapping token windows."""
+        self._initialize()
+        units = []
+        for text, count in zip(texts, self.count_tokens(texts)):
+            if count <= budget:
+                units.append(text)
+                continue
+            offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+            step = max(budget - self.chunk_overlap, 1)
+            for i in range(0, len(offsets), step):
+                window = offsets[i:i + budget]
+                units.append(text[window[0][0]:window[-1][1]].strip())
+                if i + budget >= len(offsets):
+                    break
+        return units
+
+    def _pack(self, units: list, budget: int) -> list:
+        """Packs text units into groups of at most `budget` tokens."""
+        return [units[start:end] for start, end in self._pack_ranges(self.count_tokens(units), budget)]
+
+    def _pack_ranges(self, token_counts: list, budget: int) -> list:
+        """
+        Greedily packs units into (start, end) ranges of at most `budget` tokens,
+        counting one token per separator. The next range starts with as many
+        trailing units of the previous one as fit in `chunk_overlap` tokens.
+        """
+        ranges = []
+        start = 0
+        while start < len(token_counts):
+            end = start
+            total = 0
+            while end < len(token_counts):
+                cost = token_counts[end] + (1 if end > start else 0)
+                if end > start and total + cost > budget:
+                    break
+                total += cost
+                end += 1
+            ranges.append((start, end))
+            if end >= len(token_counts):
+                break
+
+            # Carry units over only while the next unit still fits, so every range makes progress
+            next_start = end
+            carried = 0
+            while next_start - 1 > start:
+                cost = token_counts[next_start - 1] + 1
+                if carried + cost > self.chunk_overlap or carried + cost + token_counts[end] > budget:
+                    break
+                carried += cost
+                next_start -= 1
+            start = next_start
+        return ranges
@@ -0,0 +1,103 @@
+import re
+from collections import deque
+from dataclasses import dataclass, field
+
+# --- CONFIGURATION ---
+SUMMARY_TURNS = 3
+SUMMARY_ANSWER_CHARS = 200
+
+# Phrasings that mean a question depends on the previous turn. Common words such
+# as "it", "this" or "that" also appear in self-contained questions, so they only
+# count where they cannot refer to anything inside the question itself.
+FOLLOW_UP_PATTERN = re.compile(
+    # Opens by continuing the previous turn: "And for 2023?", "What about Europe?"
+    r"^(and|but|also|what about|how about|what if)\b"
+    # Explicit back-references: "the same period", "the previous answer", "the latter". Bare
+    # "previous" or "above" are not enough: "the previous quarter", "above target"
+    r"|\bthe\s+(same|former|latter|aforementioned|above)\b(?!\s+(target|average|budget|forecast|plan)\b)"
+    r"|\b(the|your)\s+(previous|last|prior|earlier)\s+(answer|result|response|reply|chart|table|list|question|one)s?\b"
+    # Plural pronouns without a noun in the question: "Which of them grew?"
+    r"|\b(of|for|about|between|compare|sort|rank|plot|chart)\s+(them|those|these)\b"
+    # A pronoun continued by a verb particle: "Break it down by region", "Sum them up"
+    r"|\b(it|that|this|them|those|these)\s+(down|up|out|over)\b"
+    # A pronoun as the subject of a question about the last answer: "How does that compare?"
+    r"|\b(it|that|this)\s+(compare[sd]?|happen(ed|s)?|mean[st]?|matter(ed|s)?|change[sd]?)\b"
+    # A demonstrative pointing at a figure from the last answer: "What drove that increase?"
+    r"|\b(that|this|these|those)\s+(increase|decrease|drop|decline|rise|jump|growth|change|shift|"
+    r"figure|number|result|answer|trend|difference|gap|value|amount|spike|dip)s?\b"
+    # Ends on a bare pronoun: "Why is that?", "Can you explain it again?"
+    r"|\b(it|that|this|them|those|these)(\s+again)?\s*[?.!]*$"
+    # Asks for another view of the last answer: "Show it as a pie chart"
+    r"|^(show|plot|chart|break down|summarize|explain|compare)\s+(it|that|this|them|those|these)\b",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class TurnRecord:
+    """A compact record of one question/answer turn."""
+    question: str
+    standalone_query: str
+    answer: str
+    chunk_ids: list = field(default_factory=list)
+    sources: list = field(default_factory=list)
+    chart_data: dict = None
+
+    def summary_line(self) -> str:
+        """A one-line description of the turn for the rolling summary."""
+        if self.chart_data:
+            x_axis = self.chart_data.get("x_axis", {})
+            y_axis = self.chart_data.get("y_axis", {})
+            points = ", ".join(f"{x}: {y}" for x, y in zip(x_axis.get("data", []), y_axis.get("data", [])))
+            answer = f"[{self.chart_data.get('chart_type', 'chart')} chart '{self.chart_data.get('title', '')}'] {points}"
+        else:
+            answer = " ".join(self.answer.split())
+        if len(answer) > SUMMARY_ANSWER_CHARS:
+            answer = answer[:SUMMARY_ANSWER_CHARS].rsplit(" ", 1)[0] + "..."
+        return f"Q: {self.standalone_query}\nA: {answer}"
+
+
+class ConversationState:
+    """
+    Incrementally maintained state of a multi-turn chat.
+
+    Each turn is stored as a TurnRecord. The rolling summary only covers the
+    last SUMMARY_TURNS turns and the chunk cache only holds the chunks of the
+    last turn, so the work per turn stays constant however long the session is.
+    """
+
+    def __init__(self):
+        self.turns = []
+        self._summary_lines = deque(maxlen=SUMMARY_TURNS)
+        # chunk_id -> (document, metadata) for the most recent turn
+        self.last_chunks = {}
+
+    @property
+    def last_turn(self):
+        return self.turns[-1] if self.turns else None
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self._summary_lines)
+
+    def is_follow_up(self, question: str) -> bool:
+        """A cheap check for questions that cannot be understood without the previous turn."""
+        return bool(self.turns) and bool(FOLLOW_UP_PATTERN.search(question.strip()))
+
+    def add_turn(self, record: TurnRecord, chunks: dict = None):
+        """Appends a turn and updates the rolling summary and chunk cache."""
+        self.turns.append(record)
+        self._summary_lines.append(record.summary_line())
+        self.last_chunks = dict(chunks or {})
+
+    def attach_chart(self, chart_data: dict):
+        """Stores the structured chart data of the last turn, replacing the raw JSON answer."""
+        if self.last_turn is None:
+            return
+        self.last_turn.chart_data = chart_data
+        self._summary_lines[-1] = self.last_turn.summary_line()
+
+    def clear(self):
+        self.turns = []
+        self._summary_lines.clear()
+        self.last_chunks = {}
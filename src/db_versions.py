@@ -0,0 +1,169 @@
+"""
+Versioned vector database directories.
+
+CHROMA_DB_PATH holds complete Chroma database directories in `versions/` and
+a small CURRENT file naming the one in use. A new database (an installed
+index bundle, a rebuilt index) is written to a new version directory and
+published by replacing CURRENT with a single os.replace, so a client opened
+at any moment sees either the complete old or the complete new database,
+never a missing or half-written one. A pointer file is used rather than a
+symlink because creating symlinks needs extra privileges on Windows.
+
+Clients open the version directory itself (see open_client), so processes
+that hold one keep working on their version after a swap. The pipelines
+compare current_version() with the version they opened and reopen when it
+changes. Superseded versions are deleted once they are no longer among the
+KEEP_VERSIONS most recent ones, which leaves running processes time to switch.
+"""
+import os
+import shutil
+import time
+import uuid
+import chromadb
+
+# --- CONFIGURATION ---
+KEEP_VERSIONS = 2
+VERSIONS_DIRNAME = "versions"
+POINTER_FILENAME = "CURRENT"
+# Version directories that are still being written carry this suffix
+BUILDING_SUFFIX = ".building"
+# Created while a database from before versioning is moved into the layout
+MIGRATION_LOCK_DIRNAME = ".migrating"
+# On Windows, replacing the pointer fails while another process is reading it
+POINTER_REPLACE_ATTEMPTS = 50
+POINTER_RETRY_SECONDS = 0.02
+
+
+def versions_dir(db_path: str) -> str:
+    return os.path.join(db_path, VERSIONS_DIRNAME)
+
+
+def _new_version_name() -> str:
+    # Names sort in creation order, which is what pruning relies on
+    return f"v{time.time_ns()}-{uuid.uuid4().hex[:6]}"
+
+
+def _read_pointer(db_path: str):
+    try:
+        with open(os.path.join(db_path, POINTER_FILENAME), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(db_path: str, version_name: str):
+    """Atomically (re)points CURRENT at a version directory."""
+    pointer_path = os.path.join(db_path, POINTER_FILENAME)
+    temp_path = f"{pointer_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(version_name)
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(POINTER_REPLACE_ATTEMPTS):
+        try:
+            os.replace(temp_path, pointer_path)
+            return
+        except PermissionError:
+            if attempt == POINTER_REPLACE_ATTEMPTS - 1:
+                os.remove(temp_path)
+                raise
+            time.sleep(POINTER_RETRY_SECONDS)
+
+
+def _migrate_legacy(db_path: str):
+    """Moves a database created before versioning into the first version directory."""
+    lock_path = os.path.join(db_path, MIGRATION_LOCK_DIRNAME)
+    try:
+        os.mkdir(lock_path)
+    except FileExistsError:
+        # Another process is migrating; wait for it to publish
+        while _read_pointer(db_path) is None and os.path.isdir(lock_path):
+            time.sleep(POINTER_RETRY_SECONDS)
+        return
+    try:
+        if _read_pointer(db_path) is not None:
+            return
+        version_name = _new_version_name()
+        version_path = os.path.join(versions_dir(db_path), version_name)
+        os.makedirs(version_path)
+        # One-time migration; a client opened in this short window sees an incomplete database
+        for name in os.listdir(db_path):
+            if name not in (VERSIONS_DIRNAME, POINTER_FILENAME, MIGRATION_LOCK_DIRNAME):
+                os.replace(os.path.join(db_path, name), os.path.join(version_path, name))
+        _write_pointer(db_path, version_name)
+    finally:
+        os.rmdir(lock_path)
+
+
+def current_path(db_path: str) -> str:
+    """
+    Returns the directory of the current version. On first use this creates
+    an empty first version, or moves a database created before versioning
+    into the versions directory.
+    """
+    version_name = _read_pointer(db_path)
+    if version_name is None:
+        os.makedirs(db_path, exist_ok=True)
+        _migrate_legacy(db_path)
+        version_name = _read_pointer(db_path)
+    return os.path.join(versions_dir(db_path), version_name)
+
+
+def current_version(db_path: str):
+    """The name of the current version directory, or None before the first use. Cheap to call."""
+    return _read_pointer(db_path)
+
+
+def open_client(db_path: str):
+    """Opens a client on the current version. Returns (client, version)."""
+    path = current_path(db_path)
+    return chromadb.PersistentClient(path=path), os.path.basename(path)
+
+
+def new_version_path(db_path: str) -> str:
+    """
+    Returns a path (not yet created) to build the next version in. Pass it to
+    publish_version when complete, or delete it if building fails.
+    """
+    # Set up the layout first, so that the new version sorts after the current one
+    current_path(db_path)
+    return os.path.join(versions_dir(db_path), _new_version_name() + BUILDING_SUFFIX)
+
+
+def finish_version(build_path: str) -> str:
+    """
+    Renames a fully built version to its final path without publishing it,
+    e.g. to open and check it where clients will open it. Returns the path.
+    """
+    version_path = build_path[:-len(BUILDING_SUFFIX)] if build_path.endswith(BUILDING_SUFFIX) else build_path
+    if version_path != build_path:
+        os.replace(build_path, version_path)
+    return version_path
+
+
+def publish_version(build_path: str, db_path: str) -> str:
+    """Makes a fully built version the current one and prunes old versions. Returns its name."""
+    # Make sure an existing (e.g. pre-versioning) database is part of the layout first
+    current_path(db_path)
+    version_path = finish_version(build_path)
+    version_name = os.path.basename(version_path)
+    _write_pointer(db_path, version_name)
+    _prune(db_path)
+    print(f"Published database version '{version_name}'.")
+    return version_name
+
+
+def _prune(db_path: str):
+    """
+    Deletes versions older than the current one, keeping the KEEP_VERSIONS
+    most recent. Newer ones may be finished but not yet published.
+    """
+    current = current_version(db_path)
+    versions = sorted(
+        name for name in os.listdir(versions_dir(db_path))
+        if not name.endswith(BUILDING_SUFFIX)
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name < current:
+            # A version another process still has open cannot be deleted on Windows; it goes on a later prune
+            shutil.rmtree(os.path.join(versions_dir(db_path), name), ignore_errors=True)
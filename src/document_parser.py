@@ -1,9 +1,8 @@
-
 import os
-from .parsers.pdf_parser import parse_pdf
-from .parsers.docx_parser import parse_docx
-from .parsers.txt_parser import parse_txt
-from .parsers.csv_parser import parse_csv
+from .parsers.pdf_parser import parse_pdf, parse_pdf_blocks
+from .parsers.docx_parser import parse_docx, parse_docx_blocks
+from .parsers.txt_parser import parse_txt, parse_txt_blocks
+from .parsers.csv_parser import parse_csv, parse_csv_blocks
 
 
 PARSER_MAPPING = {
@@ -13,6 +12,13 @@ PARSER_MAPPING = {
     '.csv': parse_csv,
 }
 
+BLOCK_PARSER_MAPPING = {
+    '.pdf': parse_pdf_blocks,
+    '.docx': parse_docx_blocks,
+    '.txt': parse_txt_blocks,
+    '.csv': parse_csv_blocks,
+}
+
 def load_document(file_path: str) -> str:
     """
     Loads a document from the given file path and returns its text content.
@@ -25,4 +31,20 @@ def load_document(file_path: str) -> str:
     
     parser = PARSER_MAPPING[extension]
     print(f"Parsing '{os.path.basename(file_path)}' with {parser.__name__}...")
-    return parser(file_path)
\ No newline at end of file
+    return parser(file_path)
+
+def load_document_blocks(file_path: str) -> list:
+    """
+    Loads a document as a list of structural blocks (headings, paragraphs,
+    tables, PDF text blocks) for structure-aware chunking. Raises if the file
+    cannot be parsed.
+    """
+    _, extension = os.path.splitext(file_path)
+
+    if extension not in BLOCK_PARSER_MAPPING:
+        raise ValueError(f"Unsupported file type: {extension}")
+
+    parser = BLOCK_PARSER_MAPPING[extension]
+    print(f"Parsing '{os.path.basename(file_path)}' with {parser.__name__}...")
+    # Parse errors propagate, so that the ingestion job is marked as failed
+    return parser(file_path)
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import pandas as pd
+
+# --- CONFIGURATION ---
+PROFILE_DB_PATH = "document_profiles.db"
+MAX_OUTLINE_ENTRIES = 50
+MAX_KEY_FIGURES = 15
+MAX_KEY_FIGURE_CHARS = 200
+MAX_TOP_VALUES = 5
+# Characters of a profile overview added to the LLM context per source document
+PROFILE_CONTEXT_CHARS = 600
+
+KEY_FIGURE_PATTERN = re.compile(
+    r"[$€£¥]\s?\d[\d,]*(?:\.\d+)?(?:\s?(?:thousand|million|billion|trillion|[kKmMbB]n?)\b)?"
+    r"|\b\d[\d,]*(?:\.\d+)?\s?(?:%|percent\b|thousand\b|million\b|billion\b|trillion\b)",
+    re.IGNORECASE
+)
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def file_content_hash(file_path: str) -> str:
+    """SHA-256 of the file bytes; identical uploads share one profile and one summary."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_key_figures(texts: list) -> list:
+    """Returns sentences that mention amounts, percentages or large numbers."""
+    figures = []
+    seen = set()
+    for text in texts:
+        for sentence in SENTENCE_SPLIT_PATTERN.split(text):
+            sentence = " ".join(sentence.split())
+            if not sentence or sentence in seen or not KEY_FIGURE_PATTERN.search(sentence):
+                continue
+            seen.add(sentence)
+            if len(sentence) > MAX_KEY_FIGURE_CHARS:
+                sentence = sentence[:MAX_KEY_FIGURE_CHARS].rsplit(" ", 1)[0] + "..."
+            figures.append(sentence)
+            if len(figures) >= MAX_KEY_FIGURES:
+                return figures
+    return figures
+
+
+def _column_statistics(header: list, rows: list) -> list:
+    """Per-column type, fill rate and either numeric summary or most frequent values."""
+    df = pd.DataFrame(rows, columns=header)
+    columns = []
+    for name in df.columns:
+        values = df[name].replace({"nan": None, "": None})
+        numeric = pd.to_numeric(values, errors='coerce')
+        stats = {
+            "name": str(name),
+            "non_null": int(values.notna().sum()),
+            "unique": int(values.nunique()),
+        }
+        if values.notna().any() and numeric.notna().sum() == values.notna().sum():
+            stats.update({
+                "type": "numeric",
+                "min": float(numeric.min()),
+                "max": float(numeric.max()),
+                "mean": round(float(numeric.mean()), 4),
+                "sum": round(float(numeric.sum()), 4),
+            })
+        else:
+            stats.update({
+                "type": "text",
+                "top_values": [str(v) for v in values.value_counts().head(MAX_TOP_VALUES).index],
+            })
+        columns.append(stats)
+    return columns
+
+
+def build_profile(file_path: str, blocks: list, content_hash: str = None) -> dict:
+    """
+    Builds a compact profile of a parsed document (see load_document_blocks):
+    outline of headings and tables, key-figure sentences, CSV column statistics
+    and size information. No LLM is involved, so this is cheap to run at ingestion.
+    """
+    _, extension = os.path.splitext(file_path)
+    outline = []
+    texts = []
+    columns = []
+    row_count = 0
+    pages = set()
+
+    for block in blocks:
+        if block['kind'] == 'heading':
+            outline.append({"level": block['level'], "text": block['text']})
+        elif block['kind'] == 'table':
+            row_count += len(block['rows'])
+            if extension == '.csv':
+                columns = _column_statistics(block['header'], block['rows'])
+            else:
+                outline.append({"level": 0, "text": "Table: " + ", ".join(block['header'])})
+        else:
+            texts.append(block['text'])
+            if 'page' in block:
+                pages.add(block['page'])
+
+    return {
+        "source": os.path.basename(file_path),
+        "content_hash": content_hash or file_content_hash(file_path),
+        "format": extension.lstrip('.'),
+        "word_count": sum(len(text.split()) for text in texts),
+        "page_count": len(pages) or None,
+        "row_count": row_count or None,
+        "outline": outline[:MAX_OUTLINE_ENTRIES],
+        "key_figures": _extract_key_figures(texts),
+        "columns": columns,
+    }
+
+
+def format_overview(profile: dict, max_chars: int = None) -> str:
+    """Renders a profile as a short plain-text overview for the UI or the LLM context."""
+    lines = [f"Document: {profile['source']} ({profile['format'].upper()})"]
+    if profile.get("page_count"):
+        lines.append(f"Pages: {profile['page_count']}")
+    if profile.get("row_count"):
+        lines.append(f"Rows: {profile['row_count']}")
+    for column in profile.get("columns", []):
+        if column["type"] == "numeric":
+            lines.append(
+                f"- {column['name']}: numeric, min {column['min']:g}, max {column['max']:g}, "
+                f"mean {column['mean']:g}, sum {column['sum']:g}"
+            )
+        else:
+            lines.append(f"- {column['name']}: {column['unique']} distinct, e.g. {', '.join(column['top_values'])}")
+    if profile.get("outline"):
+        lines.append("Outline:")
+        lines.extend(f"{'  ' * max(entry['level'] - 1, 0)}- {entry['text']}" for entry in profile["outline"])
+    if profile.get("key_figures"):
+        lines.append("Key figures:")
+        lines.extend(f"- {figure}" for figure in profile["key_figures"])
+
+    overview = "\n".join(lines)
+    if max_chars and len(overview) > max_chars:
+        overview = overview[:max_chars].rsplit("\n", 1)[0]
+    return overview
+
+
+class ProfileStore:
+    """
+    Stores document profiles in SQLite, keyed by content hash, plus the
+    LLM summary of each hash once it has been generated (or the error that
+    prevented it). Documents without a profile, e.g. those installed from an
+    index bundle, have their summary stored per source name instead.
+
+    Source names are only unique within a shard (two tenants can both have a
+    "report.pdf"), so they are always looked up together with their shard.
+    """
+
+    def __init__(self, db_path: str = PROFILE_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    content_hash TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    summary TEXT,
+                    created_at REAL NOT NULL,
+                    summarized_at REAL,
+                    summary_error TEXT
+                )
+            """)
+            # Profile databases created before summary failures were stored
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(profiles)")}
+            if "summary_error" not in columns:
+                conn.execute("ALTER TABLE profiles ADD COLUMN summary_error TEXT")
+
+            # Profile databases created before sources were keyed by shard: their
+            # links keep an empty shard, which get_by_source falls back to
+            source_columns = {row["name"] for row in conn.execute("PRAGMA table_info(sources)")}
+            if source_columns and "shard" not in source_columns:
+                conn.execute("ALTER TABLE sources RENAME TO sources_unsharded")
+            summary_columns = {row["name"] for row in conn.execute("PRAGMA table_info(source_summaries)")}
+            if summary_columns and "shard" not in summary_columns:
+                conn.execute("DROP TABLE source_summaries")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sources (
+                    shard TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    PRIMARY KEY (shard, source)
+                )
+            """)
+            if source_columns and "shard" not in source_columns:
+                conn.execute(
+                    "INSERT INTO sources (shard, source, content_hash) "
+                    "SELECT '', source, content_hash FROM sources_unsharded"
+                )
+                conn.execute("DROP TABLE sources_unsharded")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS source_summaries (
+                    shard TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    summarized_at REAL NOT NULL,
+                    PRIMARY KEY (shard, source)
+                )
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def save_profile(self, profile: dict, shard: str):
+        """
+        Stores a profile and points its source name in `shard` at it. An
+        existing summary is kept; a failed one is retried.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO profiles (content_hash, profile, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET profile = excluded.profile, summary_error = NULL",
+                (profile["content_hash"], json.dumps(profile), time.time())
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (shard, source, content_hash) VALUES (?, ?, ?)",
+                (shard, profile["source"], profile["content_hash"])
+            )
+            conn.execute(
+                "DELETE FROM source_summaries WHERE shard = ? AND source = ?", (shard, profile["source"])
+            )
+
+    def get_by_source(self, source: str, shard: str):
+        """
+        Returns the profile of the current version of a source in a shard,
+        with its 'summary' and 'summary_error' (or None).
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT p.profile, p.summary, p.summary_error FROM sources s "
+                "JOIN profiles p ON p.content_hash = s.content_hash "
+                "WHERE s.source = ? AND s.shard IN (?, '') ORDER BY s.shard = ? DESC LIMIT 1",
+                (source, shard, shard)
+            ).fetchone()
+        if row is None:
+            return None
+        profile = json.loads(row["profile"])
+        profile["summary"] = row["summary"]
+        profile["summary_error"] = row["summary_error"]
+        return profile
+
+    def set_summary(self, content_hash: str, summary: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE profiles SET summary = ?, summarized_at = ?, summary_error = NULL WHERE content_hash = ?",
+                (summary, time.time(), content_hash)
+            )
+
+    def set_summary_error(self, content_hash: str, error: str):
+        """Records why a document could not be summarized, so it is not retried until it is uploaded again."""
+        with self._connect() as conn:
+            conn.execute("UPDATE profiles SET summary_error = ? WHERE content_hash = ?", (error, content_hash))
+
+    def pending_summaries(self) -> list:
+        """
+        Returns (content_hash, shard, source) for profiles that have no
+        summary (or failed one) yet, one source per content hash.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT p.content_hash, s.shard, s.source FROM profiles p "
+                "JOIN sources s ON s.content_hash = p.content_hash "
+                "WHERE p.summary IS NULL AND p.summary_error IS NULL GROUP BY p.content_hash ORDER BY p.created_at"
+            ).fetchall()
+        return [(row["content_hash"], row["shard"], row["source"]) for row in rows]
+
+    def get_source_summary(self, source: str, shard: str):
+        """Returns the stored summary of a document that has no profile, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary FROM source_summaries WHERE shard = ? AND source = ?", (shard, source)
+            ).fetchone()
+        return row["summary"] if row else None
+
+    def set_source_summary(self, source: str, shard: str, summary: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO source_summaries (shard, source, summary, summarized_at) VALUES (?, ?, ?, ?)",
+                (shard, source, summary, time.time())
+            )
+
+    def forget_sources(self, sources: list, shard: str = None):
+        """
+        Drops the profile links and stored summaries of these source names in
+        `shard`, or in every shard, e.g. when an index bundle replaces the
+        documents they described.
+        """
+        condition = "source = ?" if shard is None else "source = ? AND shard = ?"
+        params = [(source,) if shard is None else (source, shard) for source in sources]
+        with self._connect() as conn:
+            conn.executemany(f"DELETE FROM sources WHERE {condition}", params)
+            conn.executemany(f"DELETE FROM source_summaries WHERE {condition}", params)
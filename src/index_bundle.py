@@ -0,0 +1,260 @@
+"""
+Portable, versioned index bundles.
+
+A bundle is a directory holding a ready-to-use copy of the vector database,
+so a new node can start without re-embedding or re-indexing anything:
+    manifest.json   format version, embedding model, chunking params, Chroma
+                    version, collections, counts, sources and file checksums
+    db/             a snapshot of the Chroma persist directory (SQLite file
+                    plus HNSW segment files)
+
+Exporting pauses the ingestion queue, so the snapshot is consistent.
+Installing copies `db/` into a new version directory and publishes it with an
+atomic pointer swap (see src/db_versions.py), so running processes switch
+over without downtime.
+
+Usage:
+    python -m src.index_bundle export bundles/q3-2025
+    python -m src.index_bundle import bundles/q3-2025
+    python -m src.index_bundle ensure bundles/q3-2025   # import only if not installed yet
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import chromadb
+from .chunking import CHUNK_OVERLAP_TOKENS, CHUNK_SIZE_TOKENS
+from .db_versions import current_path, current_version, finish_version, new_version_path, open_client, publish_version
+from .document_profile import ProfileStore
+from .ingestion_pipeline import CHROMA_DB_PATH, EMBEDDING_MODEL
+from .job_queue import IngestionJobQueue
+
+# --- CONFIGURATION ---
+BUNDLE_FORMAT_VERSION = 2
+MANIFEST_FILENAME = "manifest.json"
+BUNDLE_DB_DIRNAME = "db"
+# Copy of the manifest kept inside the database directory to record what is installed
+INSTALLED_MANIFEST_FILENAME = "bundle_manifest.json"
+EXPORT_PAGE_SIZE = 1000
+# How long an export waits for files that are being ingested to finish
+EXPORT_PAUSE_TIMEOUT_SECONDS = 600
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _directory_checksums(root: str) -> dict:
+    """SHA-256 of every file below root, keyed by its relative path with '/' separators."""
+    checksums = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            checksums[os.path.relpath(path, root).replace(os.sep, "/")] = _file_sha256(path)
+    return checksums
+
+
+def _replace_directory(new_path: str, target_path: str):
+    """
+    Moves a fully written bundle directory into place, replacing any previous
+    one. Only used for bundle directories; the live database is swapped
+    atomically through src/db_versions.py instead.
+    """
+    old_path = None
+    if os.path.exists(target_path):
+        old_path = f"{target_path}.old-{uuid.uuid4().hex[:8]}"
+        os.replace(target_path, old_path)
+    os.replace(new_path, target_path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _describe_collection(collection) -> tuple:
+    """Returns the manifest entry of a collection and the set of its sources."""
+    count = collection.count()
+    sources = set()
+    for offset in range(0, count, EXPORT_PAGE_SIZE):
+        page = collection.get(limit=EXPORT_PAGE_SIZE, offset=offset, include=["metadatas"])
+        sources.update((metadata or {}).get("source", "") for metadata in page["metadatas"])
+    entry = {
+        "name": collection.name, "metadata": collection.metadata, "count": count,
+        "sources": sorted(source for source in sources if source),
+    }
+    return entry, sources
+
+
+def export_bundle(bundle_path: str, db_path: str = CHROMA_DB_PATH, job_queue: IngestionJobQueue = None) -> dict:
+    """
+    Snapshots the database into a bundle directory. Ingestion is paused while
+    the persist directory is described and copied, so the copy is consistent.
+    The bundle is written to a temporary directory and moved into place at the end.
+    Returns the manifest.
+    """
+    job_queue = job_queue or IngestionJobQueue()
+    staging_dir = f"{bundle_path.rstrip(os.sep)}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(staging_dir)
+    try:
+        with job_queue.paused(timeout=EXPORT_PAUSE_TIMEOUT_SECONDS):
+            client, _ = open_client(db_path)
+            collections = []
+            sources = set()
+            for collection in client.list_collections():
+                print(f"Describing collection '{collection.name}'...")
+                entry, collection_sources = _describe_collection(collection)
+                collections.append(entry)
+                sources.update(collection_sources)
+
+            print("Copying the database directory...")
+            shutil.copytree(
+                current_path(db_path),
+                os.path.join(staging_dir, BUNDLE_DB_DIRNAME),
+                ignore=shutil.ignore_patterns(INSTALLED_MANIFEST_FILENAME)
+            )
+
+        manifest = {
+            "format_version": BUNDLE_FORMAT_VERSION,
+            "bundle_id": uuid.uuid4().hex,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "embedding_model": EMBEDDING_MODEL,
+            "chunking": {
+                "chunk_size_tokens": CHUNK_SIZE_TOKENS,
+                "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+            },
+            # The persist directory format belongs to the Chroma version that wrote it
+            "chromadb_version": chromadb.__version__,
+            "collections": collections,
+            "sources": sorted(source for source in sources if source),
+            "checksums": _directory_checksums(os.path.join(staging_dir, BUNDLE_DB_DIRNAME)),
+        }
+        with open(os.path.join(staging_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        _replace_directory(staging_dir, bundle_path)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    total = sum(entry["count"] for entry in collections)
+    print(f"Exported {total} chunks from {len(collections)} collection(s) to '{bundle_path}'.")
+    return manifest
+
+
+def read_manifest(bundle_path: str) -> dict:
+    """Reads and validates a bundle manifest."""
+    with open(os.path.join(bundle_path, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported bundle format version {manifest.get('format_version')} "
+            f"(expected {BUNDLE_FORMAT_VERSION})."
+        )
+    if manifest["embedding_model"] != EMBEDDING_MODEL:
+        raise ValueError(
+            f"Bundle was built with embedding model '{manifest['embedding_model']}', "
+            f"but this installation uses '{EMBEDDING_MODEL}'."
+        )
+    if manifest["chromadb_version"] != chromadb.__version__:
+        print(
+            f"Warning: bundle was written by chromadb {manifest['chromadb_version']}, "
+            f"this installation uses {chromadb.__version__}."
+        )
+    return manifest
+
+
+def installed_manifest(db_path: str = CHROMA_DB_PATH):
+    """Returns the manifest of the bundle the database was imported from, or None."""
+    if current_version(db_path) is None:
+        return None
+    path = os.path.join(current_path(db_path), INSTALLED_MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _verify_database(path: str, manifest: dict):
+    """Opens a copied bundle database and checks it holds the collections and counts of its manifest."""
+    try:
+        client = chromadb.PersistentClient(path=path)
+        found = {collection.name: collection.count() for collection in client.list_collections()}
+    except Exception as e:
+        raise ValueError(f"The bundle database cannot be opened with chromadb {chromadb.__version__}: {e}") from e
+    expected = {entry["name"]: entry["count"] for entry in manifest["collections"]}
+    if found != expected:
+        raise ValueError(f"The bundle database does not match its manifest: expected {expected}, found {found}.")
+
+
+def import_bundle(bundle_path: str, db_path: str = CHROMA_DB_PATH, verify_checksums: bool = True) -> dict:
+    """
+    Installs a bundle as the new current version of `db_path`.
+
+    The bundle's database directory is copied as-is, so nothing is re-embedded
+    or re-indexed. The copy is opened and checked against the manifest before
+    it is published with an atomic pointer swap, so a bundle this chromadb
+    cannot read never replaces the live index. Running pipelines notice the
+    new version and reopen the database on their next use.
+    """
+    manifest = read_manifest(bundle_path)
+    bundle_db_path = os.path.join(bundle_path, BUNDLE_DB_DIRNAME)
+    if verify_checksums:
+        for filename, checksum in manifest["checksums"].items():
+            if _file_sha256(os.path.join(bundle_db_path, *filename.split("/"))) != checksum:
+                raise ValueError(f"Checksum mismatch for '{filename}' in bundle '{bundle_path}'.")
+
+    build_path = new_version_path(db_path)
+    version_path = None
+    try:
+        shutil.copytree(bundle_db_path, build_path)
+        with open(os.path.join(build_path, INSTALLED_MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        # Checked at its final path, which is where clients will open it
+        version_path = finish_version(build_path)
+        _verify_database(version_path, manifest)
+        publish_version(version_path, db_path)
+    except Exception:
+        shutil.rmtree(version_path or build_path, ignore_errors=True)
+        raise
+    # Local profiles and summaries of these sources describe documents the bundle replaced
+    ProfileStore().forget_sources(manifest["sources"])
+
+    print(f"Installed bundle {manifest['bundle_id']} from '{bundle_path}' into '{db_path}'.")
+    return manifest
+
+
+def ensure_bundle(bundle_path: str, db_path: str = CHROMA_DB_PATH) -> dict:
+    """
+    Imports the bundle unless the database was already built from it. Meant to
+    be called at startup: an up-to-date node only reads two small JSON files.
+    """
+    manifest = read_manifest(bundle_path)
+    installed = installed_manifest(db_path)
+    if installed and installed.get("bundle_id") == manifest["bundle_id"]:
+        print(f"Bundle {manifest['bundle_id']} is already installed.")
+        return installed
+    return import_bundle(bundle_path, db_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and import portable index bundles.")
+    parser.add_argument("command", choices=["export", "import", "ensure"])
+    parser.add_argument("bundle_path")
+    parser.add_argument("--db-path", default=CHROMA_DB_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_bundle(args.bundle_path, args.db_path)
+    elif args.command == "import":
+        import_bundle(args.bundle_path, args.db_path)
+    else:
+        ensure_bundle(args.bundle_path, args.db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Retrieval index tuning and calibration.
+
+The recommended HNSW settings and top_k live in INDEX_CONFIG_PATH and are
+applied automatically by the ingestion and RAG pipelines: all HNSW parameters
+when a collection (shard) is created, the search ef to existing collections
+when the RAG pipeline opens the database, and top_k on every query. M and the
+construction ef of existing collections only change when they are rebuilt
+(rebuild_index, or --rebuild).
+
+Calibrate against the current database and write a recommendation:
+    python -m src.index_tuning --samples 200 --top-k 5 --target-recall 0.95
+    python -m src.index_tuning --rebuild        # ...and rebuild existing collections with it
+    python -m src.index_tuning --rebuild-only   # rebuild with the current index_config.json
+
+The command samples query-like snippets from the stored chunks and computes
+the exact nearest neighbours by brute force. For every combination of M and
+construction ef it then builds throwaway in-memory copies of the shards, with
+chunks split across them as in the database, and queries them through a
+ShardRouter the way the RAG pipeline does, so recall and latency include the
+per-shard top-k merge. The search ef is changed in place on the built shards,
+so each combination is built only once. Latency is the median of
+TIMING_REPEATS timed passes per query, after one warm-up pass. top_k itself
+is not swept: the recommendation is optimized for the given (or current)
+top_k, and recall is reported for the other k values to help choose it.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import time
+import uuid
+import chromadb
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+from .db_versions import current_path, finish_version, new_version_path, open_client, publish_version
+from .sharding import ShardRouter
+
+# --- CONFIGURATION ---
+INDEX_CONFIG_PATH = os.environ.get("INDEX_CONFIG_PATH", "index_config.json")
+
+# Chroma's own defaults, used until a calibration has been run
+DEFAULT_INDEX_CONFIG = {
+    "space": "l2",
+    "M": 16,
+    "construction_ef": 100,
+    "search_ef": 100,
+    "top_k": 5,
+}
+
+DEFAULT_SAMPLES = 200
+DEFAULT_TARGET_RECALL = 0.95
+DEFAULT_K_VALUES = [1, 3, 5, 10]
+DEFAULT_M_VALUES = [8, 16, 32]
+DEFAULT_CONSTRUCTION_EF_VALUES = [64, 128, 256]
+DEFAULT_SEARCH_EF_VALUES = [16, 32, 64, 128]
+QUERY_SNIPPET_WORDS = 12
+# Timed passes over the sampled queries per setting; single passes are too noisy for a p95
+TIMING_REPEATS = 5
+LOAD_PAGE_SIZE = 1000
+ADD_BATCH_SIZE = 1000
+# How long a rebuild waits for running ingestion jobs to finish their current file
+REBUILD_PAUSE_TIMEOUT_SECONDS = 600
+
+
+def load_index_config() -> dict:
+    """Returns the calibrated index settings, or Chroma's defaults if none were written."""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    if os.path.exists(INDEX_CONFIG_PATH):
+        with open(INDEX_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        config.update({key: stored[key] for key in DEFAULT_INDEX_CONFIG if key in stored})
+    return config
+
+
+def collection_metadata(config: dict) -> dict:
+    """
+    Chroma collection metadata for the given settings. HNSW parameters only
+    take effect when a collection is created; of the existing collections'
+    settings, only the search ef can be changed in place (see
+    ShardRouter.apply_search_ef), M and the construction ef need rebuild_index.
+    """
+    return {
+        "hnsw:space": config["space"],
+        "hnsw:M": config["M"],
+        "hnsw:construction_ef": config["construction_ef"],
+        "hnsw:search_ef": config["search_ef"],
+    }
+
+
+def rebuild_index(db_path: str = None, job_queue=None) -> str:
+    """
+    Rebuilds every collection with the current index config, which is the
+    only way to apply a new M or construction ef to existing collections.
+    Records are copied with their stored embeddings, so nothing is
+    re-embedded. Ingestion is paused while the copy is built and published as
+    a new database version; running pipelines reopen it on their next use.
+    Returns the new version's name.
+    """
+    # Imported here because the ingestion pipeline itself imports this module
+    from .index_bundle import INSTALLED_MANIFEST_FILENAME
+    from .ingestion_pipeline import CHROMA_DB_PATH
+    from .job_queue import IngestionJobQueue
+
+    db_path = db_path or CHROMA_DB_PATH
+    job_queue = job_queue or IngestionJobQueue()
+    metadata = collection_metadata(load_index_config())
+
+    # Built at its final path, since the open client would keep it from being renamed on Windows
+    build_path = new_version_path(db_path)
+    os.makedirs(build_path)
+    build_path = finish_version(build_path)
+    try:
+        with job_queue.paused(timeout=REBUILD_PAUSE_TIMEOUT_SECONDS):
+            source_client, _ = open_client(db_path)
+            target_client = chromadb.PersistentClient(path=build_path)
+            for collection in source_client.list_collections():
+                count = collection.count()
+                print(f"Rebuilding collection '{collection.name}' ({count} chunks)...")
+                target = target_client.create_collection(
+                    name=collection.name, metadata={**(collection.metadata or {}), **metadata}
+                )
+                for offset in range(0, count, LOAD_PAGE_SIZE):
+                    page = collection.get(
+                        limit=LOAD_PAGE_SIZE, offset=offset, include=["embeddings", "documents", "metadatas"]
+                    )
+                    target.add(
+                        ids=page["ids"], embeddings=page["embeddings"],
+                        documents=page["documents"], metadatas=page["metadatas"]
+                    )
+
+            # The rebuilt database still holds the contents of an installed bundle
+            manifest_path = os.path.join(current_path(db_path), INSTALLED_MANIFEST_FILENAME)
+            if os.path.exists(manifest_path):
+                shutil.copy2(manifest_path, os.path.join(build_path, INSTALLED_MANIFEST_FILENAME))
+
+            # Published before ingestion resumes, so no new chunks go to the old version
+            return publish_version(build_path, db_path)
+    except Exception:
+        shutil.rmtree(build_path, ignore_errors=True)
+        raise
+
+
+def _load_corpus(db_path: str, base_name: str):
+    """
+    Loads every chunk's embedding and text from all shards of the database.
+    Returns (embeddings, documents, shard sizes), with the chunks in shard order.
+    """
+    client, _ = open_client(db_path)
+    router = ShardRouter(client, base_name=base_name)
+    embeddings, documents, shard_sizes = [], [], []
+    for shard in router.list_shards():
+        count = shard.count()
+        for offset in range(0, count, LOAD_PAGE_SIZE):
+            page = shard.get(limit=LOAD_PAGE_SIZE, offset=offset, include=["embeddings", "documents"])
+            embeddings.extend(page["embeddings"])
+            documents.extend(page["documents"])
+        shard_sizes.append(count)
+    return np.asarray(embeddings, dtype=np.float32), documents, shard_sizes
+
+
+def _sample_queries(documents: list, num_samples: int, rng: random.Random) -> list:
+    """Takes a random window of words from randomly chosen chunks as query text."""
+    queries = []
+    for document in rng.sample(documents, min(num_samples, len(documents))):
+        words = document.split()
+        start = rng.randrange(max(len(words) - QUERY_SNIPPET_WORDS, 0) + 1)
+        queries.append(" ".join(words[start:start + QUERY_SNIPPET_WORDS]))
+    return queries
+
+
+def _exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Brute-force top-k indices in the same distance space Chroma uses."""
+    if space == "cosine":
+        corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        distances = -queries @ corpus.T
+    elif space == "ip":
+        distances = -queries @ corpus.T
+    else:
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(axis=1)[None, :]
+        )
+    nearest = np.argpartition(distances, kth=min(k, corpus.shape[0]) - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def _build_shards(client, corpus: np.ndarray, shard_sizes: list, params: dict):
+    """
+    Builds in-memory copies of the shards with the given HNSW params; chunk ids
+    are their row in the corpus. Returns (router over the copies, build seconds).
+    """
+    router = ShardRouter(
+        client, base_name=f"calibration-{uuid.uuid4().hex[:12]}", collection_metadata=collection_metadata(params)
+    )
+    build_start = time.perf_counter()
+    offset = 0
+    for index, size in enumerate(shard_sizes):
+        if not size:
+            continue
+        shard = router.add_shard(str(index))
+        for start in range(offset, offset + size, ADD_BATCH_SIZE):
+            end = min(start + ADD_BATCH_SIZE, offset + size)
+            shard.add(ids=[str(i) for i in range(start, end)], embeddings=corpus[start:end])
+        offset += size
+    return router, time.perf_counter() - build_start
+
+
+def _measure(router, query_embeddings: np.ndarray, exact: np.ndarray, k_values: list) -> dict:
+    """Queries the shards through the router, one query at a time, and measures recall and latency."""
+    max_k = max(k_values)
+    found = [
+        [int(i) for i in router.query(query_embeddings=[query], top_k=max_k)[0][0]]
+        for query in query_embeddings
+    ]  # also warms up the indexes
+
+    timings = [[] for _ in query_embeddings]
+    for _ in range(TIMING_REPEATS):
+        for query, query_timings in zip(query_embeddings, timings):
+            query_start = time.perf_counter()
+            router.query(query_embeddings=[query], top_k=max_k)
+            query_timings.append(time.perf_counter() - query_start)
+    latencies = sorted(statistics.median(query_timings) for query_timings in timings)
+
+    recall = {}
+    for k in k_values:
+        hits = [len(set(approx[:k]) & set(truth[:k].tolist())) / k for approx, truth in zip(found, exact)]
+        recall[k] = round(statistics.mean(hits), 4)
+
+    return {
+        "latency_p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "latency_p95_ms": round(1000 * latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 3),
+        "recall": recall,
+    }
+
+
+def calibrate(db_path: str = None, base_name: str = None, num_samples: int = DEFAULT_SAMPLES,
+              k_values: list = None, m_values: list = None, construction_ef_values: list = None,
+              search_ef_values: list = None, top_k: int = None, target_recall: float = DEFAULT_TARGET_RECALL,
+              seed: int = 0, write: bool = True) -> dict:
+    """
+    Sweeps HNSW parameters against exact search on the current corpus, split
+    into shards as in the database, and returns (and by default writes) the recommended index config: the lowest
+    p95 latency that reaches target_recall at top_k, or else the highest recall.
+    """
+    # Imported here because the ingestion pipeline itself imports this module
+    from .ingestion_pipeline import CHROMA_DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL
+
+    current = load_index_config()
+    top_k = top_k or current["top_k"]
+    k_values = sorted(set((k_values or DEFAULT_K_VALUES) + [top_k]))
+    space = current["space"]
+
+    print("Loading corpus embeddings...")
+    corpus, documents, shard_sizes = _load_corpus(db_path or CHROMA_DB_PATH, base_name or COLLECTION_NAME)
+    if len(corpus) <= max(k_values):
+        raise ValueError(f"The corpus has only {len(corpus)} chunks; ingest more documents before calibrating.")
+
+    print(f"Sampling {num_samples} queries from {len(corpus)} chunks in {len(shard_sizes)} shard(s)...")
+    queries = _sample_queries(documents, num_samples, random.Random(seed))
+    embedding_function = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'})
+    query_embeddings = np.asarray(embedding_function.embed_documents(queries), dtype=np.float32)
+
+    print("Computing exact neighbours by brute force...")
+    exact = _exact_neighbours(corpus, query_embeddings, max(k_values), space)
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for m in m_values or DEFAULT_M_VALUES:
+        for construction_ef in construction_ef_values or DEFAULT_CONSTRUCTION_EF_VALUES:
+            build_params = {"space": space, "M": m, "construction_ef": construction_ef,
+                            "search_ef": DEFAULT_INDEX_CONFIG["search_ef"]}
+            router, build_seconds = _build_shards(client, corpus, shard_sizes, build_params)
+            try:
+                for search_ef in search_ef_values or DEFAULT_SEARCH_EF_VALUES:
+                    # Changed in place, as the RAG pipeline does (ShardRouter.apply_search_ef)
+                    for shard in router.list_shards():
+                        shard.modify(configuration={"hnsw": {"ef_search": search_ef}})
+                    result = {
+                        **build_params,
+                        "search_ef": search_ef,
+                        "build_seconds": round(build_seconds, 3),
+                        **_measure(router, query_embeddings, exact, k_values),
+                    }
+                    results.append(result)
+                    recall_text = ", ".join(f"R@{k}={r:.3f}" for k, r in result["recall"].items())
+                    print(
+                        f"M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                        f"p50={result['latency_p50_ms']:.2f}ms p95={result['latency_p95_ms']:.2f}ms {recall_text}"
+                    )
+            finally:
+                for shard in router.list_shards():
+                    client.delete_collection(name=shard.name)
+
+    meeting_target = [r for r in results if r["recall"][top_k] >= target_recall]
+    if meeting_target:
+        best = min(meeting_target, key=lambda r: (r["latency_p95_ms"], r["build_seconds"]))
+    else:
+        print(f"No configuration reached recall@{top_k} >= {target_recall}; picking the highest recall.")
+        best = max(results, key=lambda r: (r["recall"][top_k], -r["latency_p95_ms"]))
+
+    recommendation = {
+        "space": space,
+        "M": best["M"],
+        "construction_ef": best["construction_ef"],
+        "search_ef": best["search_ef"],
+        "top_k": top_k,
+        "calibration": {
+            "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "corpus_size": len(corpus),
+            "samples": len(queries),
+            "target_recall": target_recall,
+            "recall": best["recall"],
+            "latency_p50_ms": best["latency_p50_ms"],
+            "latency_p95_ms": best["latency_p95_ms"],
+            "sweep": results,
+        },
+    }
+    print(
+        f"\nRecommended: M={best['M']}, construction_ef={best['construction_ef']}, "
+        f"search_ef={best['search_ef']}, top_k={top_k} "
+        f"(recall@{top_k}={best['recall'][top_k]:.3f}, p95={best['latency_p95_ms']:.2f}ms)"
+    )
+
+    if write:
+        with open(INDEX_CONFIG_PATH, 'w', encoding='utf-8') as f:
+            json.dump(recommendation, f, indent=2)
+        print(f"Wrote {INDEX_CONFIG_PATH}. New collections use these HNSW settings and existing ones the "
+              "new search ef; run with --rebuild to apply M and construction ef to existing collections.")
+    return recommendation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the retrieval index (HNSW parameters and top_k).")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Number of sampled queries.")
+    parser.add_argument("--top-k", type=int, help="top_k to optimize for (defaults to the current config).")
+    parser.add_argument("--target-recall", type=float, default=DEFAULT_TARGET_RECALL)
+    parser.add_argument("--k", type=int, nargs="+", default=DEFAULT_K_VALUES, help="k values to report recall@k for.")
+    parser.add_argument("--m", type=int, nargs="+", default=DEFAULT_M_VALUES)
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=DEFAULT_CONSTRUCTION_EF_VALUES)
+    parser.add_argument("--search-ef", type=int, nargs="+", default=DEFAULT_SEARCH_EF_VALUES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="Report the recommendation without writing it.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild existing collections with the recommended settings afterwards.")
+    parser.add_argument("--rebuild-only", action="store_true",
+                        help="Rebuild existing collections with the current index_config.json, without calibrating.")
+    args = parser.parse_args(argv)
+    if args.rebuild and args.dry_run:
+        parser.error("--rebuild needs the recommendation to be written; drop --dry-run.")
+
+    if args.rebuild_only:
+        rebuild_index()
+        return
+
+    calibrate(
+        num_samples=args.samples,
+        k_values=args.k,
+        m_values=args.m,
+        construction_ef_values=args.construction_ef,
+        search_ef_values=args.search_ef,
+        top_k=args.top_k,
+        target_recall=args.target_recall,
+        seed=args.seed,
+        write=not args.dry_run,
+    )
+    if args.rebuild:
+        rebuild_index()
+
+
+if __name__ == "__main__":
+    main()
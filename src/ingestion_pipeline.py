@@ -1,81 +1,173 @@
 import os
-import chromadb
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from .document_parser import load_document
+from .chunking import Chunker
+from .db_versions import current_version, open_client
+from .document_parser import load_document_blocks
+from .document_profile import ProfileStore, build_profile, file_content_hash
+from .index_tuning import collection_metadata, load_index_config
+from .sharding import ShardRouter
 
 # --- CONFIGURATION ---
 CHROMA_DB_PATH = "chroma_db"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 COLLECTION_NAME = "analyst_assistant_collection"
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+EMBEDDING_BATCH_SIZE = 64
+# Characters of the file's content hash in its chunk IDs, which tell versions of a file apart
+CHUNK_ID_HASH_CHARS = 12
+# Precompute a document profile (outline, key figures, column stats) for every ingested file
+BUILD_PROFILES = True
+
+
+class IngestionCancelled(Exception):
+    """Raised when an ingestion run is cancelled before it completes."""
+
 
 class IngestionPipeline:
     """A class to handle the document ingestion pipeline."""
     
-    def __init__(self):
+    def __init__(self, build_profiles: bool = BUILD_PROFILES):
+        self.build_profiles = build_profiles
+        self.profile_store = None
         self.db_client = None
-        self.collection = None
+        self.db_version = None
+        self.router = None
         self.embedding_function = None
-        self.text_splitter = None
+        self.chunker = None
+
+    def _open_database(self):
+        """Opens the current database version; see src/db_versions.py."""
+        self.db_client, self.db_version = open_client(CHROMA_DB_PATH)
+
+        # Decides which collection (shard) each document goes to; see src/sharding.py.
+        # New shards get the calibrated HNSW settings from index_config.json.
+        self.router = ShardRouter(
+            self.db_client,
+            base_name=COLLECTION_NAME,
+            collection_metadata=collection_metadata(load_index_config())
+        )
 
     def _initialize(self):
         """Initializes all components of the pipeline. This is called on demand."""
         print("Initializing ingestion pipeline components...")
         
 
-        self.db_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-
-        self.collection = self.db_client.get_or_create_collection(name=COLLECTION_NAME)
+        self._open_database()
 
         self.embedding_function = HuggingFaceEmbeddings(
             model_name=EMBEDDING_MODEL,
             model_kwargs={'device': 'cpu'} # Use 'cuda' if you have a GPU
         )
 
-        # 4. Initialize the text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len
-        )
+        # 4. Initialize the chunker; chunk sizes are measured in embedding-model tokens
+        self.chunker = Chunker(tokenizer_name=f"sentence-transformers/{EMBEDDING_MODEL}")
+
+        if self.build_profiles:
+            self.profile_store = ProfileStore()
         print("Initialization complete.")
 
-    def ingest_file(self, file_path: str):
+    def ingest_file(self, file_path: str, progress_callback=None, should_cancel=None,
+                    tenant: str = None, group: str = None):
         """
         The main ingestion pipeline function for a single file.
+
+        The file is stored in the shard chosen by the router's strategy from
+        its name, `tenant` or `group`, and removed from any other shard that
+        may hold an older copy (see ShardRouter.overlapping_shards).
+
+        Chunks are embedded and stored in batches of EMBEDDING_BATCH_SIZE.
+        `progress_callback(chunks_done, chunks_total)` is called after every
+        batch, and `should_cancel()` is checked before every batch; when it
+        returns True, IngestionCancelled is raised. Returns the number of
+        chunks stored.
+
+        Chunk IDs include the file's content hash, so a new version of a file
+        is stored next to the previous one, which is deleted only after every
+        new chunk is stored. If storing fails or is cancelled, the new chunks
+        are removed again and the previous version stays complete.
         """
 
-        if self.collection is None:
+        if self.router is None:
             self._initialize()
+        elif current_version(CHROMA_DB_PATH) != self.db_version:
+            print("The database was replaced (e.g. by an index bundle); reopening it...")
+            self._open_database()
 
         print(f"--- Starting ingestion for {file_path} ---")
         
 
-        text_content = load_document(file_path)
-        if not text_content:
+        print("Parsing and chunking document...")
+        blocks = load_document_blocks(file_path)
+        chunks = self.chunker.chunk_blocks(file_path, blocks)
+        if not chunks:
             print(f"No content extracted from {file_path}. Skipping.")
-            return
-
-
-        print("Splitting text into chunks...")
-        chunks = self.text_splitter.split_text(text_content)
-        
-
-        ids = [f"{os.path.basename(file_path)}_{i}" for i in range(len(chunks))]
+            return 0
         
 
-        print(f"Storing {len(chunks)} chunks in ChromaDB...")
-        self.collection.add(
-            documents=chunks,
-            ids=ids,
-            metadatas=[{'source': os.path.basename(file_path)} for _ in ids]
-        )
+        source = os.path.basename(file_path)
+        content_hash = file_content_hash(file_path)
+        ids = [f"{source}_{content_hash[:CHUNK_ID_HASH_CHARS]}_{i}" for i in range(len(chunks))]
+        metadatas = [{'source': source, **chunk.metadata} for chunk in chunks]
+        chunk_texts = [chunk.text for chunk in chunks]
+        collection = self.router.get_or_create_shard(self.router.shard_for(source, tenant=tenant, group=group))
+
+        if progress_callback:
+            progress_callback(0, len(chunks))
+
+        # Chunk IDs of the stored version of this file (the same IDs if its content is unchanged)
+        previous_ids = set(collection.get(where={'source': source}, include=[])['ids'])
+
+        print(f"Storing {len(chunks)} chunks in ChromaDB collection '{collection.name}'...")
+        stored_ids = []
+        try:
+            for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+                if should_cancel and should_cancel():
+                    raise IngestionCancelled(f"Ingestion of {file_path} was cancelled.")
+
+                end = start + EMBEDDING_BATCH_SIZE
+                # Upsert so that re-running an interrupted job does not fail on existing IDs
+                collection.upsert(
+                    documents=chunk_texts[start:end],
+                    embeddings=self.embedding_function.embed_documents(chunk_texts[start:end]),
+                    ids=ids[start:end],
+                    metadatas=metadatas[start:end]
+                )
+                stored_ids.extend(ids[start:end])
+
+                if progress_callback:
+                    progress_callback(len(stored_ids), len(chunks))
+        except Exception:
+            # Cancelled or failed: drop the partial new version, the previous one is untouched
+            partial_ids = [chunk_id for chunk_id in stored_ids if chunk_id not in previous_ids]
+            if partial_ids:
+                print(f"Removing {len(partial_ids)} partially stored chunks...")
+                collection.delete(ids=partial_ids)
+            raise
+
+        stale_ids = sorted(previous_ids - set(ids))
+        if stale_ids:
+            print(f"Removing {len(stale_ids)} chunks of the previous version...")
+            collection.delete(ids=stale_ids)
+
+        # A source is stored in one shard; drop copies left in others, e.g. after SHARD_COUNT changed
+        for shard in self.router.overlapping_shards(collection.name):
+            shard_ids = shard.get(where={'source': source}, include=[])['ids']
+            if shard_ids:
+                print(f"Removing {len(shard_ids)} chunks of this file from shard '{shard.name}'...")
+                shard.delete(ids=shard_ids)
+                if self.profile_store is not None:
+                    self.profile_store.forget_sources([source], shard=shard.name)
+
+        if self.profile_store is not None:
+            print("Building document profile...")
+            self.profile_store.save_profile(build_profile(file_path, blocks, content_hash=content_hash), collection.name)
         
         print(f"--- Ingestion complete for {file_path} ---")
-
+        return len(chunks)
 
 def get_db_collection():
-    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    return client.get_collection(name=COLLECTION_NAME)
\ No newline at end of file
+    client, _ = open_client(CHROMA_DB_PATH)
+    return client.get_collection(name=COLLECTION_NAME)
+
+def get_shard_router():
+    client, _ = open_client(CHROMA_DB_PATH)
+    return ShardRouter(client, base_name=COLLECTION_NAME, collection_metadata=collection_metadata(load_index_config()))
\ No newline at end of file
@@ -0,0 +1,406 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from .ingestion_pipeline import IngestionPipeline, IngestionCancelled
+
+# --- CONFIGURATION ---
+JOB_DB_PATH = "ingestion_jobs.db"
+NUM_WORKERS = 1
+POLL_INTERVAL_SECONDS = 0.5
+# A pause whose holder crashed stops blocking the workers after this long
+PAUSE_LEASE_SECONDS = 3600
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+
+
+class IngestionJobQueue:
+    """
+    A persistent queue of ingestion jobs, processed by background worker threads.
+
+    Jobs and their per-file progress live in a SQLite database, so they survive
+    a page refresh or a server restart. Each worker owns one IngestionPipeline,
+    which means the embedding model is loaded once per worker rather than once
+    per upload.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, num_workers: int = NUM_WORKERS):
+        self.db_path = db_path
+        self.num_workers = num_workers
+        self._workers = []
+        self._stop_event = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._create_tables()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_tables(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    tenant TEXT,
+                    group_name TEXT
+                )
+            """)
+            # Job databases created before jobs carried a tenant and group
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("tenant", "group_name"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_files (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    chunks_total INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (job_id, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pauses (
+                    id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    # --- Public API ---
+
+    def submit(self, file_paths: list, tenant: str = None, group: str = None) -> str:
+        """
+        Queues a new ingestion job for the given files and returns its ID.
+        `tenant` and `group` pick the shard with those sharding strategies.
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at, tenant, group_name) VALUES (?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, time.time(), tenant, group)
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, file_path, status) VALUES (?, ?, ?, ?)",
+                [(job_id, i, path, STATUS_QUEUED) for i, path in enumerate(file_paths)]
+            )
+        print(f"Queued ingestion job {job_id} for {len(file_paths)} file(s).")
+        return job_id
+
+    def cancel(self, job_id: str):
+        """
+        Requests cancellation of a job. Queued jobs are cancelled immediately,
+        running jobs stop before their next batch of chunks.
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED)
+            )
+            conn.execute(
+                "UPDATE job_files SET status = ? WHERE job_id = ? AND status = ?",
+                (STATUS_CANCELLED, job_id, STATUS_QUEUED)
+            )
+
+    def cancel_all(self):
+        """Requests cancellation of every job that has not finished yet."""
+        for job in self.list_jobs(active_only=True):
+            self.cancel(job["id"])
+
+    def wait_until_idle(self, timeout: float = None) -> bool:
+        """
+        Blocks until no job is running, e.g. after cancel_all(), so that no
+        worker is in the middle of writing to the database. Returns False if
+        jobs are still running after `timeout` seconds.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            with self._connect() as conn:
+                running = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_RUNNING,)
+                ).fetchone()[0]
+            if not running:
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    @contextlib.contextmanager
+    def paused(self, timeout: float = None):
+        """
+        Holds back the workers of every process sharing this queue, e.g. while
+        the database is snapshotted. Files that are being ingested are finished
+        first; no new file starts until the block exits. Raises TimeoutError if
+        the running files do not finish within `timeout` seconds.
+        """
+        pause_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO pauses (id, expires_at) VALUES (?, ?)",
+                (pause_id, time.time() + PAUSE_LEASE_SECONDS)
+            )
+        try:
+            deadline = time.time() + timeout if timeout is not None else None
+            while True:
+                with self._connect() as conn:
+                    running = conn.execute(
+                        "SELECT COUNT(*) FROM job_files WHERE status = ?", (STATUS_RUNNING,)
+                    ).fetchone()[0]
+                if not running:
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    raise TimeoutError(f"{running} file(s) are still being ingested.")
+                time.sleep(POLL_INTERVAL_SECONDS)
+            print("Ingestion is paused.")
+            yield
+        finally:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM pauses WHERE id = ?", (pause_id,))
+            print("Ingestion is resumed.")
+
+    def get_job(self, job_id: str):
+        """Returns a job with its per-file progress and ETA, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            files = conn.execute(
+                "SELECT * FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return self._describe(row, files)
+
+    def list_jobs(self, active_only: bool = False, limit: int = 20) -> list:
+        """Returns the most recent jobs, newest first."""
+        query = "SELECT id FROM jobs"
+        if active_only:
+            query += f" WHERE status IN ('{STATUS_QUEUED}', '{STATUS_RUNNING}')"
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._connect() as conn:
+            job_ids = [row["id"] for row in conn.execute(query, (limit,)).fetchall()]
+        return [job for job in (self.get_job(job_id) for job_id in job_ids) if job is not None]
+
+    def indexed_files(self, tenant: str = None, group: str = None) -> list:
+        """
+        Returns the base names of all files that were ingested successfully,
+        only those submitted for `tenant` or `group` if given.
+        """
+        query = (
+            "SELECT f.file_path FROM job_files f JOIN jobs j ON j.id = f.job_id WHERE f.status = ?"
+            + (" AND j.tenant = ?" if tenant else "")
+            + (" AND j.group_name = ?" if group else "")
+            + " ORDER BY f.rowid"
+        )
+        params = [STATUS_COMPLETED] + [value for value in (tenant, group) if value]
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return list(dict.fromkeys(os.path.basename(row["file_path"]) for row in rows))
+
+    def clear_history(self):
+        """Removes all finished jobs, e.g. after the database has been cleared."""
+        with self._connect() as conn:
+            placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+            conn.execute(
+                f"DELETE FROM job_files WHERE job_id IN (SELECT id FROM jobs WHERE status IN ({placeholders}))",
+                FINISHED_STATUSES
+            )
+            conn.execute(f"DELETE FROM jobs WHERE status IN ({placeholders})", FINISHED_STATUSES)
+
+    def start(self):
+        """Starts the worker threads. Jobs interrupted by a previous shutdown are re-queued."""
+        if self._workers:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+            conn.execute(
+                "UPDATE job_files SET status = ?, chunks_done = 0 WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+
+        self._stop_event.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Started {self.num_workers} ingestion worker(s).")
+
+    def stop(self):
+        """Signals the workers to stop once their current batch is done."""
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    # --- Worker internals ---
+
+    def _worker_loop(self):
+        pipeline = IngestionPipeline()
+        while not self._stop_event.is_set():
+            job_id = self._claim_next_job()
+            if job_id is None:
+                self._stop_event.wait(POLL_INTERVAL_SECONDS)
+                continue
+            self._run_job(pipeline, job_id)
+
+    def _claim_next_job(self):
+        with self._claim_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (STATUS_RUNNING, time.time(), row["id"])
+            )
+            return row["id"]
+
+    def _is_cancel_requested(self, job_id: str) -> bool:
+        if self._stop_event.is_set():
+            return True
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or bool(row["cancel_requested"])
+
+    def _start_file(self, job_id: str, position: int) -> bool:
+        """
+        Marks a file as running unless ingestion is paused. Checking and marking
+        in one statement means paused() never misses a file that is starting.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE job_files SET status = ? WHERE job_id = ? AND position = ? "
+                "AND NOT EXISTS (SELECT 1 FROM pauses WHERE expires_at > ?)",
+                (STATUS_RUNNING, job_id, position, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def _set_file_status(self, job_id: str, position: int, status: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_files SET status = ? WHERE job_id = ? AND position = ?",
+                (status, job_id, position)
+            )
+
+    def _finish_job(self, job_id: str, status: str, error: str = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id)
+            )
+            conn.execute(
+                "UPDATE job_files SET status = ? WHERE job_id = ? AND status IN (?, ?)",
+                (status, job_id, STATUS_QUEUED, STATUS_RUNNING)
+            )
+
+    def _run_job(self, pipeline: IngestionPipeline, job_id: str):
+        with self._connect() as conn:
+            job = conn.execute("SELECT tenant, group_name FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            files = conn.execute(
+                "SELECT position, file_path FROM job_files WHERE job_id = ? AND status = ? ORDER BY position",
+                (job_id, STATUS_QUEUED)
+            ).fetchall()
+
+        for file_row in files:
+            position = file_row["position"]
+
+            def report_progress(chunks_done, chunks_total):
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE job_files SET chunks_done = ?, chunks_total = ? WHERE job_id = ? AND position = ?",
+                        (chunks_done, chunks_total, job_id, position)
+                    )
+
+            while True:
+                if self._is_cancel_requested(job_id):
+                    # A stop (not a user cancel) leaves the job running so start() re-queues it
+                    if not self._stop_event.is_set():
+                        self._finish_job(job_id, STATUS_CANCELLED)
+                    return
+                if self._start_file(job_id, position):
+                    break
+                # Paused, e.g. while the database is being snapshotted
+                self._stop_event.wait(POLL_INTERVAL_SECONDS)
+
+            try:
+                pipeline.ingest_file(
+                    file_row["file_path"],
+                    progress_callback=report_progress,
+                    should_cancel=lambda: self._is_cancel_requested(job_id),
+                    tenant=job["tenant"],
+                    group=job["group_name"]
+                )
+            except IngestionCancelled:
+                if not self._stop_event.is_set():
+                    self._finish_job(job_id, STATUS_CANCELLED)
+                return
+            except Exception as e:
+                print(f"Error ingesting {file_row['file_path']}: {e}")
+                self._finish_job(job_id, STATUS_FAILED, error=str(e))
+                return
+            self._set_file_status(job_id, position, STATUS_COMPLETED)
+
+        self._finish_job(job_id, STATUS_COMPLETED)
+
+    @staticmethod
+    def _describe(row, files) -> dict:
+        """Builds a plain dict for a job, including overall progress and an ETA in seconds."""
+        file_progress = []
+        fraction_done = 0.0
+        for f in files:
+            if f["status"] == STATUS_COMPLETED:
+                fraction = 1.0
+            elif f["chunks_total"]:
+                fraction = f["chunks_done"] / f["chunks_total"]
+            else:
+                fraction = 0.0
+            fraction_done += fraction
+            file_progress.append({
+                "file_name": os.path.basename(f["file_path"]),
+                "status": f["status"],
+                "chunks_done": f["chunks_done"],
+                "chunks_total": f["chunks_total"],
+                "fraction": fraction,
+            })
+
+        progress = fraction_done / len(files) if files else 0.0
+        eta_seconds = None
+        if row["status"] == STATUS_RUNNING and row["started_at"] and progress > 0:
+            elapsed = time.time() - row["started_at"]
+            eta_seconds = elapsed * (1 - progress) / progress
+
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "error": row["error"],
+            "tenant": row["tenant"],
+            "group": row["group_name"],
+            "cancel_requested": bool(row["cancel_requested"]),
+            "files": file_progress,
+            "files_done": sum(1 for f in files if f["status"] == STATUS_COMPLETED),
+            "files_total": len(files),
+            "progress": progress,
+            "eta_seconds": eta_seconds,
+        }
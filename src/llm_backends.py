@@ -0,0 +1,215 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+# --- CONFIGURATION ---
+# Settings are read from LLM_CONFIG_PATH (JSON) if it exists, then from
+# environment variables named LLM_<SETTING> (e.g. LLM_BACKEND=llama_cpp,
+# LLM_THREADS=8), so inference can be tuned per machine without code changes.
+LLM_CONFIG_PATH = os.environ.get("LLM_CONFIG_PATH", "llm_config.json")
+
+DEFAULT_LLM_CONFIG = {
+    "backend": "ctransformers",          # "ctransformers" or "llama_cpp"
+    # "model_path": "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf",
+    "model_path": "models/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf",
+    "model_type": "llama",               # ctransformers only, e.g. "mistral"
+    "context_length": 4096,
+    "max_new_tokens": 512,
+    "temperature": 0.1,
+    "threads": None,                     # None lets the runtime pick
+    "batch_size": 512,                   # prompt (prefill) batch size
+    "gpu_layers": 1,                     # Set to a value > 0 if you have a supported GPU
+    "use_mmap": True,
+    "use_mlock": False,
+    # llama_cpp only, speculative decoding: None (off), "model" to draft with a
+    # small GGUF model that shares the main model's vocabulary (e.g. TinyLlama
+    # for a Llama-family model) or "prompt_lookup" to draft from the prompt itself.
+    "draft_mode": None,
+    "draft_model_path": None,            # used with draft_mode "model"
+    "draft_tokens": 4,
+}
+DRAFT_MODES = (None, "model", "prompt_lookup")
+
+
+def load_llm_config(overrides: dict = None) -> dict:
+    """Builds the LLM settings from the defaults, the JSON config file, env vars and overrides."""
+    config = dict(DEFAULT_LLM_CONFIG)
+
+    if os.path.exists(LLM_CONFIG_PATH):
+        with open(LLM_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+
+    for key in DEFAULT_LLM_CONFIG:
+        value = os.environ.get(f"LLM_{key.upper()}")
+        if value is not None:
+            # Numbers, booleans and null are given as JSON; anything else is a plain string
+            try:
+                config[key] = json.loads(value)
+            except ValueError:
+                config[key] = value
+
+    config.update(overrides or {})
+
+    unknown = set(config) - set(DEFAULT_LLM_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown LLM settings: {', '.join(sorted(unknown))}")
+    if config["draft_mode"] not in DRAFT_MODES:
+        raise ValueError(f"Unsupported draft_mode: {config['draft_mode']}")
+    if config["draft_mode"] == "model" and not config["draft_model_path"]:
+        raise ValueError('draft_mode "model" needs a draft_model_path.')
+    return config
+
+
+class LLMBackend(ABC):
+    """
+    The interface the RAG pipeline uses to talk to a local model.
+    Backends are called like a function with a prompt and return the generated text.
+    """
+
+    name = None
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    @property
+    def context_length(self) -> int:
+        return self.config["context_length"]
+
+    @abstractmethod
+    def generate(self, prompt: str, max_new_tokens: int = None) -> str:
+        """Generates a completion of the prompt."""
+
+    @abstractmethod
+    def count_tokens(self, text: str) -> int:
+        """Counts the tokens of a text with the model's tokenizer."""
+
+    def __call__(self, prompt: str, max_new_tokens: int = None) -> str:
+        return self.generate(prompt, max_new_tokens=max_new_tokens)
+
+
+class CTransformersBackend(LLMBackend):
+    """GGUF inference through ctransformers."""
+
+    name = "ctransformers"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        from ctransformers import AutoModelForCausalLM
+
+        self.llm = AutoModelForCausalLM.from_pretrained(
+            config["model_path"],
+            model_type=config["model_type"],
+            gpu_layers=config["gpu_layers"],
+            temperature=config["temperature"],
+            max_new_tokens=config["max_new_tokens"],
+            context_length=config["context_length"],
+            threads=config["threads"] if config["threads"] is not None else -1,
+            batch_size=config["batch_size"],
+            mmap=config["use_mmap"],
+            mlock=config["use_mlock"],
+        )
+
+    def generate(self, prompt: str, max_new_tokens: int = None) -> str:
+        return self.llm(prompt, max_new_tokens=max_new_tokens or self.config["max_new_tokens"])
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text))
+
+
+class LlamaCppBackend(LLMBackend):
+    """GGUF inference through llama-cpp-python, with optional speculative decoding."""
+
+    name = "llama_cpp"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        from llama_cpp import Llama
+
+        self.llm = Llama(
+            model_path=config["model_path"],
+            n_ctx=config["context_length"],
+            n_threads=config["threads"],
+            n_threads_batch=config["threads"],
+            n_batch=config["batch_size"],
+            n_gpu_layers=config["gpu_layers"],
+            use_mmap=config["use_mmap"],
+            use_mlock=config["use_mlock"],
+            draft_model=self._create_draft_model(config),
+            verbose=False,
+        )
+
+    @staticmethod
+    def _create_draft_model(config: dict):
+        if config["draft_mode"] is None:
+            return None
+        from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+        if config["draft_mode"] == "prompt_lookup":
+            return LlamaPromptLookupDecoding(num_pred_tokens=config["draft_tokens"])
+        # Registered here so that this module imports without llama-cpp-python installed
+        LlamaDraftModel.register(LlamaModelDraft)
+        return LlamaModelDraft(config["draft_model_path"], config)
+
+    def generate(self, prompt: str, max_new_tokens: int = None) -> str:
+        output = self.llm(
+            prompt,
+            max_tokens=max_new_tokens or self.config["max_new_tokens"],
+            temperature=self.config["temperature"],
+        )
+        return output["choices"][0]["text"]
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+
+class LlamaModelDraft:
+    """
+    Drafts tokens for speculative decoding with a second, smaller llama.cpp model
+    (e.g. TinyLlama drafting for a larger Llama-family model). The main model
+    verifies the drafted tokens in a single batch, so output is unchanged; the
+    speed-up depends on how often the draft is accepted. Both models must use
+    the same tokenizer vocabulary.
+
+    Implements llama_cpp's LlamaDraftModel interface and is registered as one
+    when a draft model is created (see LlamaCppBackend._create_draft_model).
+    """
+
+    def __init__(self, model_path: str, config: dict):
+        from llama_cpp import Llama
+
+        self.num_draft_tokens = config["draft_tokens"]
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=config["context_length"],
+            n_threads=config["threads"],
+            n_threads_batch=config["threads"],
+            n_batch=config["batch_size"],
+            use_mmap=config["use_mmap"],
+            verbose=False,
+        )
+
+    def __call__(self, input_ids, /, **kwargs):
+        import numpy as np
+
+        drafted = []
+        # Greedy drafting; generate() reuses the cached prefix shared with the previous call
+        for token in self.model.generate(input_ids.tolist(), temp=0.0):
+            drafted.append(token)
+            if token == self.model.token_eos() or len(drafted) >= self.num_draft_tokens:
+                break
+        return np.array(drafted, dtype=np.intc)
+
+
+LLM_BACKENDS = {
+    CTransformersBackend.name: CTransformersBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def create_llm_backend(config: dict = None) -> LLMBackend:
+    """Loads the backend named in the config (see load_llm_config)."""
+    config = config or load_llm_config()
+    if config["backend"] not in LLM_BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {config['backend']}")
+    print(f"Loading LLM with the {config['backend']} backend: {config['model_path']}")
+    return LLM_BACKENDS[config["backend"]](config)
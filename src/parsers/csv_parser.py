@@ -1,5 +1,14 @@
 import pandas as pd
 
+def parse_csv_blocks(file_path: str) -> list:
+    """
+    Parses a CSV file into a single table block:
+    {'kind': 'table', 'header': [...], 'rows': [[...], ...]}.
+    """
+    df = pd.read_csv(file_path)
+    rows = [[str(val) for val in row] for row in df.itertuples(index=False, name=None)]
+    return [{'kind': 'table', 'header': [str(col) for col in df.columns], 'rows': rows}]
+
 def parse_csv(file_path: str) -> str:
     """
     Parses a CSV file, converting each row into a human-readable sentence.
@@ -14,4 +23,4 @@ def parse_csv(file_path: str) -> str:
         return "\n".join(text_list)
     except Exception as e:
         print(f"Error parsing CSV {file_path}: {e}")
-        return ""
\ No newline at end of file
+        return ""
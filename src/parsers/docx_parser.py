@@ -1,10 +1,44 @@
 import docx
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+def parse_docx_blocks(file_path: str) -> list:
+    """
+    Extracts the body of a DOCX file as an ordered list of blocks.
+    Headings become {'kind': 'heading', 'level': n}, tables become
+    {'kind': 'table', 'header': [...], 'rows': [[...], ...]} and everything
+    else becomes {'kind': 'paragraph'}.
+    """
+    doc = docx.Document(file_path)
+    blocks = []
+    for element in doc.element.body.iterchildren():
+        if element.tag.endswith('}p'):
+            para = Paragraph(element, doc)
+            text = para.text.strip()
+            if not text:
+                continue
+            style_name = para.style.name if para.style is not None else ""
+            if style_name.startswith("Heading") or style_name == "Title":
+                level = style_name.replace("Heading", "").strip()
+                blocks.append({'kind': 'heading', 'text': text, 'level': int(level) if level.isdigit() else 1})
+            else:
+                blocks.append({'kind': 'paragraph', 'text': text})
+        elif element.tag.endswith('}tbl'):
+            rows = [[cell.text.strip() for cell in row.cells] for row in Table(element, doc).rows]
+            if rows:
+                blocks.append({'kind': 'table', 'header': rows[0], 'rows': rows[1:]})
+    return blocks
 
 def parse_docx(file_path: str) -> str:
-    """Extracts text content from a DOCX file."""
+    """Extracts text content, including tables, from a DOCX file."""
     try:
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        lines = []
+        for block in parse_docx_blocks(file_path):
+            if block['kind'] == 'table':
+                lines.extend(" | ".join(row) for row in [block['header']] + block['rows'])
+            else:
+                lines.append(block['text'])
+        return "\n".join(lines)
     except Exception as e:
         print(f"Error parsing DOCX {file_path}: {e}")
-        return ""
\ No newline at end of file
+        return ""
@@ -1,5 +1,23 @@
 import fitz 
 
+def parse_pdf_blocks(file_path: str) -> list:
+    """
+    Extracts the text blocks of a PDF file in reading order.
+    Each block is {'kind': 'paragraph', 'text': ..., 'page': n} with 1-based pages.
+    """
+    doc = fitz.open(file_path)
+    blocks = []
+    try:
+        for page_number, page in enumerate(doc, start=1):
+            # Each entry is (x0, y0, x1, y1, text, block_no, block_type); type 0 is text
+            for block in page.get_text("blocks", sort=True):
+                text = block[4].strip()
+                if block[6] == 0 and text:
+                    blocks.append({'kind': 'paragraph', 'text': text, 'page': page_number})
+    finally:
+        doc.close()
+    return blocks
+
 def parse_pdf(file_path: str) -> str:
     """Extracts text content from a PDF file."""
     try:
@@ -11,4 +29,4 @@ def parse_pdf(file_path: str) -> str:
         return text
     except Exception as e:
         print(f"Error parsing PDF {file_path}: {e}")
-        return ""
\ No newline at end of file
+        return ""
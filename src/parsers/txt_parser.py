@@ -1,3 +1,11 @@
+import re
+
+def parse_txt_blocks(file_path: str) -> list:
+    """Splits a TXT file into paragraph blocks on blank lines."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return [{'kind': 'paragraph', 'text': para.strip()} for para in re.split(r'\n\s*\n', text) if para.strip()]
+
 def parse_txt(file_path: str) -> str:
     """Reads content from a TXT file."""
     try:
@@ -5,4 +13,4 @@ def parse_txt(file_path: str) -> str:
             return f.read()
     except Exception as e:
         print(f"Error parsing TXT {file_path}: {e}")
-        return ""
\ No newline at end of file
+        return ""
@@ -0,0 +1,57 @@
+import threading
+from .document_profile import ProfileStore
+from .rag_pipeline import RAGPipeline
+
+# --- CONFIGURATION ---
+POLL_INTERVAL_SECONDS = 5.0
+
+
+class ProfileSummarizer:
+    """
+    Generates the LLM summary of every profiled document in a background thread.
+
+    Summaries are stored per content hash, so each distinct document is
+    summarized once, however often it is uploaded. The summarizer owns its own
+    RAGPipeline (and LLM instance) because a model must not be shared between
+    threads that generate at the same time.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.store = ProfileStore()
+        self.pipeline = RAGPipeline()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profile-summarizer", daemon=True)
+        self._thread.start()
+        print("Started background document summarizer.")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for content_hash, shard, source in self.store.pending_summaries():
+                if self._stop_event.is_set():
+                    return
+                try:
+                    # Only this shard's chunks: another tenant may have a document of the same name
+                    summary, error = self.pipeline.generate_summary(source, shard_names=[shard] if shard else None)
+                except Exception as e:
+                    summary, error = None, str(e)
+                if summary is None:
+                    # Stored, so the document is not retried and its failure can be shown
+                    print(f"Could not summarize {source}: {error}")
+                    self.store.set_summary_error(content_hash, error)
+                    continue
+                self.store.set_summary(content_hash, summary)
+                print(f"Stored background summary for {source}.")
+            self._stop_event.wait(self.poll_interval)
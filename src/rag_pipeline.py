@@ -1,15 +1,20 @@
-import chromadb
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.prompts import PromptTemplate
-from ctransformers import AutoModelForCausalLM
 from src.charting_schema import CHART_JSON_SCHEMA, EXAMPLE_JSON_OUTPUT
+from src.conversation_state import ConversationState, TurnRecord
+from src.llm_backends import create_llm_backend, load_llm_config
+from src.sharding import SHARD_METADATA_KEY, ShardRouter
+from src.document_profile import PROFILE_CONTEXT_CHARS, ProfileStore, format_overview
+from src.index_tuning import collection_metadata, load_index_config
+from src.db_versions import current_version, open_client
 
 # --- CONFIGURATION ---
 CHROMA_DB_PATH = "chroma_db"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 COLLECTION_NAME = "analyst_assistant_collection"
-# LLM_MODEL_PATH = "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf"
-LLM_MODEL_PATH = "models/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
+QUERY_REWRITE_MAX_TOKENS = 64
+# Chunks of the previous turn carried over into a follow-up's context
+REUSED_CHUNKS_PER_FOLLOW_UP = 2
 
 QA_PROMPT_TEMPLATE = """
 ### Instruction:
@@ -50,6 +55,19 @@ You are a helpful AI analyst. Based on the user's original question and the answ
 ### Suggested Follow-up Questions:
 """
 
+QUERY_REWRITE_PROMPT_TEMPLATE = """
+### Instruction:
+Rewrite the follow-up question as a single standalone question that can be understood without the conversation. Keep names, numbers and entities from the conversation that the question refers to. Output only the rewritten question.
+
+### Conversation so far:
+{summary}
+
+### Follow-up Question:
+{question}
+
+### Standalone Question:
+"""
+
 ADVANCED_QA_PROMPT_TEMPLATE = f"""
 ### Instruction:
 You are an expert data analyst AI. Your task is to answer the user's question based *only* on the provided context.
@@ -76,17 +94,40 @@ You have two ways to answer:
 class RAGPipeline:
     def __init__(self):
         self.db_client = None
-        self.collection = None
+        self.db_version = None
+        self.router = None
+        self.index_config = None
         self.embedding_function = None
         self.llm = None
         self.prompt = None
+        # Profiles are plain SQLite reads, so they are usable without loading any model
+        self.profile_store = ProfileStore()
+
+    def _open_database(self):
+        """Opens the current database version; see src/db_versions.py."""
+        self.db_client, self.db_version = open_client(CHROMA_DB_PATH)
+        # Queries fan out over every shard collection; see src/sharding.py.
+        # top_k and the HNSW settings of new shards come from index_config.json;
+        # the search ef is also applied to existing shards.
+        self.index_config = load_index_config()
+        self.router = ShardRouter(
+            self.db_client,
+            base_name=COLLECTION_NAME,
+            collection_metadata=collection_metadata(self.index_config),
+            search_ef=self.index_config["search_ef"]
+        )
 
     def _initialize(self):
-        """Initializes the database client and embedding function."""
-        if self.collection is None:
+        """
+        Initializes the database client and embedding function. Also reopens
+        the database when a new version was published, e.g. by an index bundle.
+        """
+        if self.router is not None and current_version(CHROMA_DB_PATH) != self.db_version:
+            print("The database was replaced (e.g. by an index bundle); reopening it...")
+            self._open_database()
+        if self.router is None:
             print("Initializing RAG pipeline components...")
-            self.db_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-            self.collection = self.db_client.get_collection(name=COLLECTION_NAME)
+            self._open_database()
             
             self.embedding_function = HuggingFaceEmbeddings(
                 model_name=EMBEDDING_MODEL,
@@ -94,15 +135,8 @@ class RAGPipeline:
             )
             print("Loading local LLM...")
             
-            self.llm = AutoModelForCausalLM.from_pretrained(
-                LLM_MODEL_PATH,
-                #model_type="mistral",
-                model_type="llama",
-                gpu_layers=1,  # Set to a value > 0 if you have a supported GPU
-                temperature=0.1,
-                max_new_tokens=512,
-                context_length=4096 
-            )
+            # Backend, model and threading settings come from llm_config.json / LLM_* env vars
+            self.llm = create_llm_backend(load_llm_config())
             print("LLM loaded.")
             
             # Create the prompt from the template
@@ -110,6 +144,10 @@ class RAGPipeline:
                 template=QA_PROMPT_TEMPLATE,
                 input_variables=['context', 'question']
             )
+            self.rewrite_prompt = PromptTemplate(
+                template=QUERY_REWRITE_PROMPT_TEMPLATE,
+                input_variables=['summary', 'question']
+            )
             self.next_steps_prompt = PromptTemplate(
                 template=NEXT_STEPS_PROMPT_TEMPLATE,
                 input_variables=['question', 'answer']
@@ -120,78 +158,227 @@ class RAGPipeline:
             )
             print("RAG components initialized.")
 
-    def retrieve_chunks(self, query: str, top_k: int = 5):
+    def retrieve_chunks(self, query: str, top_k: int = None, shard_names: list = None):
         """
         Retrieves the top_k most relevant chunks from the database.
+        top_k defaults to the calibrated value in index_config.json.
+        `shard_names` restricts the search to some shards (e.g. one tenant).
         """
         self._initialize()
-
+        top_k = top_k or self.index_config["top_k"]
         print(f"Retrieving top {top_k} relevant chunks for query: '{query}'")
-        
-        query_embedding = self.embedding_function.embed_query(query)
-
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-        )
-        
-        retrieved_docs = results['documents'][0]
-        retrieved_metadatas = results['metadatas'][0]
-
+        _, retrieved_docs, retrieved_metadatas = self._query_collection([query], top_k, shard_names)[0]
         print(f"Found {len(retrieved_docs)} relevant chunks.")
         
         return retrieved_docs, retrieved_metadatas
-    
 
-    def generate_answer(self, query: str, chat_history: list = []):
+    def retrieve_chunks_batch(self, queries: list, top_k: int = None, shard_names: list = None):
         """
-        The main RAG chain function.
-        1. Retrieves relevant context.
-        2. Formats the prompt.
-        3. Generates an answer with the LLM.
-        4. Returns the answer and the source documents.
+        Retrieves the top_k most relevant chunks for several queries at once.
+        The queries are embedded in one batch and sent to each shard in a single
+        query call. Returns a list of (documents, metadatas) pairs, one per query.
         """
+        self._initialize()
+        top_k = top_k or self.index_config["top_k"]
+        return [(docs, metadatas) for _, docs, metadatas in self._query_collection(queries, top_k, shard_names)]
 
+    def _query_collection(self, queries: list, top_k: int, shard_names: list = None):
+        """
+        Embeds the queries in one batch, searches all shards in parallel and
+        returns the global top_k as (ids, documents, metadatas) per query.
+        """
         self._initialize()
 
-        full_query = query
-        if chat_history:
-            # Add the last Q&A pair to the query for context
-            last_question, last_answer = chat_history[-1]
-            full_query = f"Considering the previous question was '{last_question}', now answer this: {query}"
+        if not queries:
+            return []
+
+        query_embeddings = self.embedding_function.embed_documents(queries)
 
-        # 1. Retrieve context
-        retrieved_docs, retrieved_metadatas = self.retrieve_chunks(full_query)
+        return self.router.query(query_embeddings, top_k, shard_names=shard_names)
+
+    def rewrite_query(self, query: str, conversation: ConversationState) -> str:
+        """
+        Turns a follow-up question into a standalone query using the rolling
+        conversation summary. Questions that do not refer back to the
+        conversation are returned unchanged, without an LLM call.
+        """
+        if conversation is None or not conversation.is_follow_up(query):
+            return query
+
+        self._initialize()
+        print("Rewriting follow-up question as a standalone query...")
+        rewritten = self.llm(
+            self.rewrite_prompt.format(summary=conversation.summary, question=query),
+            max_new_tokens=QUERY_REWRITE_MAX_TOKENS
+        )
+        rewritten = rewritten.strip().split("\n")[0].strip().strip('"')
+        print(f"Standalone query: '{rewritten}'")
+        return rewritten or query
+
+    def shard_names_for(self, tenant: str = None, group: str = None):
+        """The shards to search for a tenant or document group (None for all); see src/sharding.py."""
+        # Shard names are derived from the name alone, so no model has to be loaded for this
+        router = self.router or ShardRouter(None, base_name=COLLECTION_NAME)
+        return router.shard_names_for(tenant=tenant, group=group)
+
+    def generate_answer(self, query: str, conversation: ConversationState = None, top_k: int = None,
+                        shard_names: list = None):
+        """
+        The main RAG chain function. `shard_names` restricts retrieval to some
+        shards, e.g. those of one tenant (see shard_names_for).
+        1. Rewrites follow-up questions into a standalone query.
+        2. Retrieves relevant context, reusing the previous turn's best chunks for follow-ups.
+        3. Formats the prompt and generates an answer with the LLM.
+        4. Records the turn in the conversation state, if one is given.
+        Returns the answer, the source metadatas and the next-step suggestions.
+        """
+
+        self._initialize()
+        top_k = top_k or self.index_config["top_k"]
+
+        standalone_query = self.rewrite_query(query, conversation)
+        is_follow_up = standalone_query != query
+
+        # 1. Retrieve context; a follow-up keeps some room for chunks the previous turn already found
+        reused = []
+        if is_follow_up and conversation.last_chunks:
+            reused = list(conversation.last_chunks.items())[:min(REUSED_CHUNKS_PER_FOLLOW_UP, top_k - 1)]
+        print(f"Retrieving top {top_k - len(reused)} relevant chunks for query: '{standalone_query}'")
+        ids, docs, metadatas = self._query_collection([standalone_query], top_k - len(reused), shard_names)[0]
+
+        chunks = dict(zip(ids, zip(docs, metadatas)))
+        for chunk_id, chunk in reused:
+            chunks.setdefault(chunk_id, chunk)
+        print(f"Using {len(chunks)} chunks ({len(reused)} carried over from the previous turn).")
+
+        retrieved_docs = [doc for doc, _ in chunks.values()]
+        retrieved_metadatas = [meta for _, meta in chunks.values()]
+        response, sources, next_steps = self.generate_from_context(
+            standalone_query, retrieved_docs, retrieved_metadatas, original_question=query
+        )
+
+        if conversation is not None:
+            conversation.add_turn(
+                TurnRecord(
+                    question=query,
+                    standalone_query=standalone_query,
+                    answer=response,
+                    chunk_ids=list(chunks),
+                    sources=sorted({meta.get('source', 'N/A') for meta in retrieved_metadatas}),
+                ),
+                chunks=chunks
+            )
+
+        return response, sources, next_steps
+
+    def generate_from_context(self, query: str, retrieved_docs: list, retrieved_metadatas: list,
+                              include_next_steps: bool = True, original_question: str = None):
+        """
+        Generates an answer from already-retrieved chunks.
+        `original_question` is the user's own wording when `query` is a rewritten
+        follow-up; both are given to the LLM so that nothing the user asked for
+        is lost in the rewrite.
+        Returns the answer, the source metadatas and the next-step suggestions
+        (None when include_next_steps is False).
+        """
+        self._initialize()
         
         # Check if any context was retrieved
         if not retrieved_docs:
             print("No relevant context found. Cannot generate answer.")
-            return "I could not find any relevant information in the uploaded documents to answer your question."
+            return "I could not find any relevant information in the uploaded documents to answer your question.", [], None
 
         # 2. Format the context for the prompt
-        # We'll join the documents together with a clear separator.
-        context_str = "\n\n---\n\n".join(retrieved_docs)
+        # We'll join the documents together with a clear separator,
+        # led by the precomputed overviews of the source documents.
+        context_str = "\n\n---\n\n".join(self._document_overviews(retrieved_metadatas) + retrieved_docs)
 
         # 3. Format the final prompt
-        formatted_prompt = self.prompt.format(context=context_str, question=query)
+        question = query
+        if original_question and original_question != query:
+            question = f"{query}\n(In the conversation, the user asked: \"{original_question}\")"
+        formatted_prompt = self.prompt.format(context=context_str, question=question)
         
         # 4. Generate the answer
         print("Generating answer...")
         response = self.llm(formatted_prompt)
-         # --- NEW: GENERATE NEXT STEPS ---
-        print("Generating next step suggestions...")
-        next_steps_formatted_prompt = self.next_steps_prompt.format(
-            question=query,
-            answer=response
-        )
-        next_steps = self.llm(next_steps_formatted_prompt)
+
+        next_steps = None
+        if include_next_steps:
+            print("Generating next step suggestions...")
+            next_steps_formatted_prompt = self.next_steps_prompt.format(
+                question=query,
+                answer=response
+            )
+            next_steps = self.llm(next_steps_formatted_prompt)
         print("Answer generation complete. Returning response and sources.")
 
         return response, retrieved_metadatas, next_steps
     
-    def summarize_document(self, source_filename: str):
+    def _document_overviews(self, metadatas: list) -> list:
+        """
+        Short profile overviews of the distinct source documents, for the LLM
+        context. Each document is looked up in the shard its chunks came from.
         """
-        Summarizes the content of a specific document stored in the database.
+        overviews = []
+        documents = dict.fromkeys((meta.get(SHARD_METADATA_KEY), meta.get('source')) for meta in metadatas)
+        for shard, source in documents:
+            profile = self.profile_store.get_by_source(source, shard) if source and shard else None
+            if profile:
+                overviews.append(format_overview(profile, max_chars=PROFILE_CONTEXT_CHARS))
+        return overviews
+
+    def summarize_document(self, source_filename: str, generate_if_missing: bool = True, shard_names: list = None):
+        """
+        Returns the summary of a specific document stored in the database.
+        `shard_names` restricts the lookup to some shards, e.g. those of one
+        tenant (see shard_names_for); if several hold a document by this name,
+        the first in name order is summarized.
+
+        Summaries are stored in the profile store per content hash, so an
+        unchanged document is only ever summarized once; documents without a
+        profile (e.g. from an index bundle) have theirs stored per source name.
+        When no summary is stored yet, it is generated now (and stored), or,
+        with generate_if_missing=False, the precomputed profile overview is
+        returned while the background summarizer catches up.
+        """
+        self._initialize()
+        shards = self.router.shards_with_source(source_filename, shard_names)
+        if not shards:
+            return f"Could not find a document named '{source_filename}' in the database."
+        shard = shards[0]
+
+        profile = self.profile_store.get_by_source(source_filename, shard)
+        if profile and profile["summary"]:
+            print(f"Using stored summary for document: {source_filename}")
+            return profile["summary"]
+        if profile and profile["summary_error"]:
+            return format_overview(profile) + f"\n\n_A full summary could not be generated: {profile['summary_error']}_"
+        if profile and not generate_if_missing:
+            return format_overview(profile) + "\n\n_A full summary is being generated in the background._"
+        if not profile:
+            summary = self.profile_store.get_source_summary(source_filename, shard)
+            if summary:
+                print(f"Using stored summary for document: {source_filename}")
+                return summary
+
+        summary, error = self.generate_summary(source_filename, shard_names=[shard])
+        if summary is None:
+            if profile:
+                self.profile_store.set_summary_error(profile["content_hash"], error)
+            return error
+        if profile:
+            self.profile_store.set_summary(profile["content_hash"], summary)
+        else:
+            self.profile_store.set_source_summary(source_filename, shard, summary)
+        return summary
+
+    def generate_summary(self, source_filename: str, shard_names: list = None):
+        """
+        Summarizes a document with the LLM. Returns (summary, None) on success
+        and (None, error message) when the document cannot be summarized.
+        Pass the document's shard as `shard_names`, so that documents of the
+        same name in other shards are not mixed in.
         """
         self._initialize()
 
@@ -199,20 +386,20 @@ class RAGPipeline:
 
         # Use ChromaDB's 'where' filter to get all chunks for a specific file
         # Note: The value in the where filter must match the metadata value exactly.
-        results = self.collection.get(where={"source": source_filename})
+        results = self.router.get(where={"source": source_filename}, shard_names=shard_names)
         
         all_docs = results['documents']
 
         if not all_docs:
-            return f"Could not find a document named '{source_filename}' in the database."
+            return None, f"Could not find a document named '{source_filename}' in the database."
 
-        # Join all chunks into a single text block
-        full_text = "\n".join(all_docs)
+        # Join all chunks into a single text block, in document order (IDs end in the chunk index)
+        ordered = sorted(zip(results['ids'], all_docs), key=lambda item: int(item[0].rsplit('_', 1)[-1]))
+        full_text = "\n".join(doc for _, doc in ordered)
 
         # Check if the text is too long for the context window
-        # (A simple check, can be improved with a proper tokenizer later)
-        if len(full_text) > (self.llm.config.context_length * 3): # Approx 3 chars per token
-             return "The document is too large to summarize with the current method."
+        if self.llm.count_tokens(full_text) > self.llm.context_length - self.llm.config["max_new_tokens"]:
+             return None, "The document is too large to summarize with the current method."
 
         # A new, simple prompt for one-shot summarization
         summary_prompt = f"""
@@ -227,4 +414,4 @@ class RAGPipeline:
         print("Generating summary...")
         summary = self.llm(summary_prompt)
         
-        return summary
\ No newline at end of file
+        return summary, None
@@ -0,0 +1,207 @@
+import hashlib
+import heapq
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+# "single": one collection (the default, same layout as before sharding)
+# "tenant": one collection per tenant
+# "group":  one collection per document group
+# "hash":   SHARD_COUNT collections, chosen by a hash of the source file name
+SHARD_STRATEGY = os.environ.get("SHARD_STRATEGY", "single")
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "4"))
+FAN_OUT_WORKERS = 8
+SHARD_SEPARATOR = "__"
+DEFAULT_SHARD_KEY = "default"
+SHARD_STRATEGIES = ("single", "tenant", "group", "hash")
+# Chroma's limit on collection names
+MAX_COLLECTION_NAME_LENGTH = 63
+KEY_HASH_CHARS = 10
+# Added to the metadata of chunks returned by query and get (not stored)
+SHARD_METADATA_KEY = "shard"
+
+# Shared by all routers so concurrent queries do not each spin up a pool
+_fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="shard-query")
+
+
+class ShardRouter:
+    """
+    Maps documents to collections (shards) and fans queries out across them.
+
+    Every shard is a separate Chroma collection named `<base_name>__<shard>`
+    (or just `<base_name>` with the "single" strategy), so each has its own,
+    bounded HNSW index and shards can be added or dropped independently.
+    Queries run against all shards in parallel and the per-shard results are
+    merged into a global top-k by distance.
+
+    A source name identifies one document per tenant (or group) with those
+    strategies, and one document per index otherwise; re-ingesting a document
+    removes it from the other shards it may be in (see overlapping_shards).
+    The naming methods do not use the client, which can be None for them.
+    """
+
+    def __init__(self, client, base_name: str, strategy: str = SHARD_STRATEGY, num_hash_shards: int = SHARD_COUNT,
+                 collection_metadata: dict = None, search_ef: int = None):
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unsupported shard strategy: {strategy}")
+        self.client = client
+        self.base_name = base_name
+        self.strategy = strategy
+        self.num_hash_shards = num_hash_shards
+        # Applied to newly created shards, e.g. the calibrated HNSW settings
+        self.collection_metadata = collection_metadata
+        if search_ef is not None:
+            self.apply_search_ef(search_ef)
+
+    def apply_search_ef(self, search_ef: int):
+        """
+        Sets the HNSW search ef of every existing shard. Unlike M and the
+        construction ef, it can be changed without rebuilding the index.
+        """
+        for shard in self.list_shards():
+            hnsw = (shard.configuration or {}).get("hnsw") or {}
+            if hnsw.get("ef_search") != search_ef:
+                print(f"Setting search ef of shard '{shard.name}' to {search_ef}...")
+                shard.modify(configuration={"hnsw": {"ef_search": search_ef}})
+
+    def shard_name(self, shard_key: str = None) -> str:
+        """
+        Returns the collection name for a shard key; Chroma allows [a-zA-Z0-9._-]
+        only. Keys that have to be sanitized or shortened get a hash of the raw
+        key appended, so that e.g. "a b" and "a-b" never share a shard.
+        """
+        if shard_key is None:
+            return self.base_name
+        safe_key = re.sub(r"[^a-zA-Z0-9_-]", "-", shard_key).strip("-_") or DEFAULT_SHARD_KEY
+        name = f"{self.base_name}{SHARD_SEPARATOR}{safe_key}"
+        if safe_key != shard_key or len(name) > MAX_COLLECTION_NAME_LENGTH:
+            suffix = "-" + hashlib.sha256(shard_key.encode("utf-8")).hexdigest()[:KEY_HASH_CHARS]
+            name = name[:MAX_COLLECTION_NAME_LENGTH - len(suffix)].rstrip("-_") + suffix
+        return name
+
+    def shard_for(self, source: str, tenant: str = None, group: str = None) -> str:
+        """Picks the shard (collection name) a document is stored in."""
+        if self.strategy == "tenant":
+            return self.shard_name(f"tenant-{tenant or DEFAULT_SHARD_KEY}")
+        if self.strategy == "group":
+            return self.shard_name(f"group-{group or DEFAULT_SHARD_KEY}")
+        if self.strategy == "hash":
+            return self.shard_name(f"hash-{zlib.crc32(source.encode('utf-8')) % self.num_hash_shards}")
+        return self.shard_name()
+
+    def shard_names_for(self, tenant: str = None, group: str = None):
+        """
+        The shards a query for a tenant or document group has to search, or
+        None for all shards (also when the strategy does not shard by it).
+        """
+        if self.strategy == "tenant" and tenant:
+            return [self.shard_for("", tenant=tenant)]
+        if self.strategy == "group" and group:
+            return [self.shard_for("", group=group)]
+        return None
+
+    def overlapping_shards(self, shard_name: str) -> list:
+        """
+        Existing shards other than `shard_name` that may hold an older copy of
+        a document now stored in it, e.g. after SHARD_COUNT or the strategy
+        changed. Other tenants' or groups' shards hold separate documents, even
+        under the same name, and are not included.
+        """
+        scoped_prefix = f"{self.base_name}{SHARD_SEPARATOR}{self.strategy}-"
+        return [
+            shard for shard in self.list_shards()
+            if shard.name != shard_name
+            and not (self.strategy in ("tenant", "group") and shard.name.startswith(scoped_prefix))
+        ]
+
+    def get_or_create_shard(self, name: str):
+        return self.client.get_or_create_collection(name=name, metadata=self.collection_metadata)
+
+    def add_shard(self, shard_key: str):
+        """Creates an empty shard, e.g. for a new tenant, without touching the others."""
+        return self.get_or_create_shard(self.shard_name(shard_key))
+
+    def drop_shard(self, name: str):
+        """Deletes a shard and everything in it."""
+        print(f"Dropping shard '{name}'...")
+        self.client.delete_collection(name=name)
+
+    def list_shards(self) -> list:
+        """Returns all existing shard collections, in name order."""
+        prefix = f"{self.base_name}{SHARD_SEPARATOR}"
+        shards = [
+            collection for collection in self.client.list_collections()
+            if collection.name == self.base_name or collection.name.startswith(prefix)
+        ]
+        return sorted(shards, key=lambda collection: collection.name)
+
+    def _select_shards(self, shard_names: list = None) -> list:
+        shards = self.list_shards()
+        if shard_names is not None:
+            shards = [shard for shard in shards if shard.name in shard_names]
+        return shards
+
+    def query(self, query_embeddings: list, top_k: int, shard_names: list = None, where: dict = None) -> list:
+        """
+        Queries the shards in parallel and merges the results.
+        Returns one (ids, documents, metadatas) triple per query embedding,
+        holding the global top_k chunks across all shards. Each metadata
+        names the shard its chunk came from under SHARD_METADATA_KEY.
+        """
+        shards = self._select_shards(shard_names)
+        if not shards:
+            return [([], [], []) for _ in query_embeddings]
+
+        def query_shard(shard):
+            return shard.query(query_embeddings=query_embeddings, n_results=top_k, where=where)
+
+        shard_results = list(_fan_out_executor.map(query_shard, shards))
+
+        merged = []
+        for i in range(len(query_embeddings)):
+            candidates = []
+            for shard, results in zip(shards, shard_results):
+                candidates.extend(zip(
+                    results['distances'][i], results['ids'][i], results['documents'][i],
+                    [{**(metadata or {}), SHARD_METADATA_KEY: shard.name} for metadata in results['metadatas'][i]]
+                ))
+            best = heapq.nsmallest(top_k, candidates, key=lambda candidate: candidate[0])
+            merged.append((
+                [candidate[1] for candidate in best],
+                [candidate[2] for candidate in best],
+                [candidate[3] for candidate in best],
+            ))
+        return merged
+
+    def get(self, where: dict = None, ids: list = None, shard_names: list = None) -> dict:
+        """
+        Fetches chunks from all shards in parallel and concatenates them in
+        shard order. Metadatas name their shard, as with query.
+        """
+        shards = self._select_shards(shard_names)
+
+        def get_from_shard(shard):
+            return shard.get(where=where, ids=ids)
+
+        combined = {'ids': [], 'documents': [], 'metadatas': []}
+        for shard, results in zip(shards, _fan_out_executor.map(get_from_shard, shards)):
+            combined['ids'].extend(results['ids'])
+            combined['documents'].extend(results['documents'])
+            combined['metadatas'].extend(
+                {**(metadata or {}), SHARD_METADATA_KEY: shard.name} for metadata in results['metadatas']
+            )
+        return combined
+
+    def shards_with_source(self, source: str, shard_names: list = None) -> list:
+        """Names of the shards (in name order) that hold chunks of a source document."""
+        shards = self._select_shards(shard_names)
+
+        def has_source(shard):
+            return bool(shard.get(where={'source': source}, limit=1, include=[])['ids'])
+
+        return [shard.name for shard, found in zip(shards, _fan_out_executor.map(has_source, shards)) if found]
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.list_shards())
@@ -0,0 +1,102 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer
+import pytest
+
+batch_qa = pytest.importorskip("src.batch_qa")
+from src.batch_qa import BatchQARequestHandler, read_questions  # noqa: E402
+
+
+class StubScheduler:
+    """Answers every question immediately, echoing it back."""
+
+    def shard_names_for(self, tenant, group):
+        return [f"tenant-{tenant}"] if tenant else None
+
+    def submit(self, question, item_id, shard_names=None):
+        future = Future()
+        future.set_result({"id": item_id, "question": question, "answer": "42", "shards": shard_names})
+        return future
+
+    def map(self, items):
+        for item_id, question, tenant, group in items:
+            yield self.submit(question, item_id, self.shard_names_for(tenant, group)).result()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(BatchQARequestHandler, "scheduler", StubScheduler())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BatchQARequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body: bytes):
+    request = urllib.request.Request(url, data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def test_read_questions_accepts_strings_and_objects():
+    lines = [
+        '"What was revenue?"',
+        "",
+        '{"id": "q2", "question": "And costs?", "tenant": "acme"}',
+        '{"question": "Headcount?", "group": "hr"}',
+    ]
+    assert read_questions(lines) == [
+        (1, "What was revenue?", None, None),
+        ("q2", "And costs?", "acme", None),
+        (4, "Headcount?", None, "hr"),
+    ]
+
+
+@pytest.mark.parametrize("line", ['{"id": "q1"}', '{"question": 3}', "[1, 2]", "42"])
+def test_read_questions_rejects_records_without_a_question(line):
+    with pytest.raises(ValueError, match="Line 1"):
+        read_questions([line])
+
+
+def test_read_questions_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        read_questions(["{not json"])
+
+
+def test_query_returns_the_answer(server):
+    status, body = post(f"{server}/query", b'{"id": "q1", "question": "Revenue?", "tenant": "acme"}')
+    assert status == 200
+    assert json.loads(body) == {"id": "q1", "question": "Revenue?", "answer": "42", "shards": ["tenant-acme"]}
+
+
+def test_batch_streams_jsonl(server):
+    status, body = post(f"{server}/batch", b'"Revenue?"\n{"id": "q2", "question": "Costs?"}\n')
+    assert status == 200
+    assert [json.loads(line)["question"] for line in body.splitlines()] == ["Revenue?", "Costs?"]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/query", b"{not json"),
+    ("/query", b'{"id": "q1"}'),
+    ("/query", b""),
+    ("/query", b"\xff\xfe"),
+    ("/batch", b'"ok"\n{"question": 3}\n'),
+    ("/batch", b"\n\n"),
+])
+def test_invalid_requests_get_400(server, path, body):
+    status, response = post(f"{server}{path}", body)
+    assert status == 400
+    assert json.loads(response)["error"].startswith("Invalid request")
+
+
+def test_unknown_paths_get_404(server):
+    status, _ = post(f"{server}/answer", b'"Revenue?"')
+    assert status == 404
@@ -0,0 +1,30 @@
+import pytest
+
+chart_generator = pytest.importorskip("src.chart_generator")
+
+
+def test_short_series_is_unchanged():
+    x, y = list(range(10)), [i * i for i in range(10)]
+    assert chart_generator._downsample_series(x, y, 10) == (x, y)
+
+
+def test_long_series_keeps_endpoints_and_order():
+    x = [f"day {i}" for i in range(1000)]
+    y = [(i % 37) * (-1) ** i for i in range(1000)]
+
+    sampled_x, sampled_y = chart_generator._downsample_series(x, y, 50)
+
+    assert len(sampled_x) == len(sampled_y) == 50
+    assert sampled_x[0] == "day 0" and sampled_x[-1] == "day 999"
+    indices = [x.index(label) for label in sampled_x]
+    assert indices == sorted(set(indices))
+    assert all(y[i] == value for i, value in zip(indices, sampled_y))
+
+
+def test_long_series_keeps_a_spike():
+    y = [0.0] * 500
+    y[321] = 100.0
+
+    _, sampled_y = chart_generator._downsample_series(list(range(500)), y, 20)
+
+    assert 100.0 in sampled_y
@@ -0,0 +1,111 @@
+import re
+import pytest
+
+chunking = pytest.importorskip("src.chunking")
+
+
+class WhitespaceTokenizer:
+    """Counts every run of non-space characters as one token, like a tokenizer with offsets."""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if return_offsets_mapping:
+            return {'offset_mapping': [match.span() for match in re.finditer(r"\S+", texts)]}
+        return {'input_ids': [re.findall(r"\S+", text) for text in texts]}
+
+
+def make_chunker(chunk_size=40, chunk_overlap=5):
+    chunker = chunking.Chunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunker.tokenizer = WhitespaceTokenizer()
+    return chunker
+
+
+def token_count(text):
+    return len(text.split())
+
+
+def test_pack_ranges_respects_the_budget_with_separators():
+    chunker = make_chunker(chunk_overlap=1)
+    ranges = chunker._pack_ranges([5, 5, 5, 5], budget=11)
+    assert ranges == [(0, 2), (2, 4)]
+
+
+def test_pack_ranges_carries_overlap():
+    chunker = make_chunker(chunk_overlap=6)
+    ranges = chunker._pack_ranges([5, 5, 5, 5], budget=11)
+    assert ranges == [(0, 2), (1, 3), (2, 4)]
+
+
+def test_pack_ranges_always_makes_progress():
+    chunker = make_chunker(chunk_overlap=30)
+    ranges = chunker._pack_ranges([20, 20, 20], budget=30)
+    assert ranges == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_pack_ranges_keeps_an_oversized_unit_on_its_own():
+    chunker = make_chunker(chunk_overlap=1)
+    assert chunker._pack_ranges([3, 50, 3], budget=10) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_narrow_table_repeats_the_header():
+    chunker = make_chunker(chunk_size=20, chunk_overlap=1)
+    header = ["region", "revenue"]
+    rows = [[f"r{i}", str(i)] for i in range(20)]
+
+    chunks = chunker.chunk_blocks("sales.csv", [{'header': header, 'rows': rows}])
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.text.startswith("region | revenue\n")
+        assert token_count(chunk.text) <= 20
+        assert 'column_start' not in chunk.metadata
+    assert chunks[0].metadata['row_start'] == 1
+    assert chunks[-1].metadata['row_end'] == 20
+
+
+def test_wide_table_is_split_into_column_groups_within_the_budget():
+    chunker = make_chunker(chunk_size=30, chunk_overlap=2)
+    header = [f"column{c}" for c in range(40)]
+    rows = [[f"value{r}-{c}" for c in range(40)] for r in range(5)]
+
+    chunks = chunker.chunk_blocks("wide.csv", [{'header': header, 'rows': rows}])
+
+    covered = set()
+    for chunk in chunks:
+        assert token_count(chunk.text) <= 30
+        start, end = chunk.metadata['column_start'], chunk.metadata['column_end']
+        lead, *lines = chunk.text.split("\n")
+        # Each column group repeats only its own header cells
+        assert lead == " | ".join(header[start - 1:end])
+        for line in lines:
+            assert all(cell.endswith(tuple(f"-{c}" for c in range(start - 1, end))) for cell in line.split(" | "))
+        covered.update(range(start, end + 1))
+    assert covered == set(range(1, 41))
+
+
+def test_docx_table_lead_and_row_fit_in_a_chunk():
+    chunker = make_chunker(chunk_size=30, chunk_overlap=2)
+    blocks = [
+        {'kind': 'heading', 'level': 1, 'text': "Annual report 2023"},
+        {'kind': 'table', 'header': [f"h{c}" for c in range(30)],
+         'rows': [[f"cell {r} {c}" for c in range(30)] for r in range(3)]},
+    ]
+
+    chunks = chunker.chunk_blocks("report.docx", blocks)
+
+    assert chunks
+    for chunk in chunks:
+        assert chunk.text.startswith("Annual report 2023\n")
+        assert chunk.metadata['section'] == "Annual report 2023"
+        assert token_count(chunk.text) <= 30
+
+
+def test_long_section_prefix_keeps_the_table_header():
+    chunker = make_chunker(chunk_size=20, chunk_overlap=2)
+    prefix = " ".join(f"heading{i}" for i in range(50))
+
+    chunks = chunker._chunk_table(["a", "b"], [["1", "2"], ["3", "4"]], prefix=prefix)
+
+    assert len(chunks) == 1
+    assert chunks[0].text.endswith("\na | b\n1 | 2\n3 | 4")
+    assert token_count(chunks[0].text) <= 20
+    assert chunks[0].metadata['section'] == prefix
@@ -0,0 +1,38 @@
+import pytest
+from src.conversation_state import FOLLOW_UP_PATTERN, ConversationState, TurnRecord
+
+
+@pytest.mark.parametrize("question", [
+    "And for 2023?",
+    "What about Europe?",
+    "Break it down by region",
+    "What drove that increase?",
+    "How does that compare with last year?",
+    "Which of them grew fastest?",
+    "Show it as a pie chart",
+    "Can you explain it again?",
+    "Why is that?",
+    "Use the same period for the other product.",
+    "Summarize the previous answer in one sentence.",
+])
+def test_follow_up_questions_match(question):
+    assert FOLLOW_UP_PATTERN.search(question)
+
+
+@pytest.mark.parametrize("question", [
+    "What was revenue in the previous quarter?",
+    "Which regions were above target in 2023?",
+    "Is it profitable to expand into Asia?",
+    "What does the report say about churn?",
+    "List the products above average margin.",
+    "How many employees does the company have?",
+])
+def test_self_contained_questions_do_not_match(question):
+    assert not FOLLOW_UP_PATTERN.search(question)
+
+
+def test_first_question_is_never_a_follow_up():
+    state = ConversationState()
+    assert not state.is_follow_up("And for 2023?")
+    state.add_turn(TurnRecord(question="Revenue in 2022?", standalone_query="Revenue in 2022?", answer="$4M"))
+    assert state.is_follow_up("And for 2023?")
@@ -0,0 +1,70 @@
+import os
+import pytest
+
+db_versions = pytest.importorskip("src.db_versions")
+from src.db_versions import (  # noqa: E402
+    BUILDING_SUFFIX, KEEP_VERSIONS, current_path, current_version, new_version_path, publish_version, versions_dir
+)
+
+
+def build_version(db_path, marker):
+    build_path = new_version_path(str(db_path))
+    os.makedirs(build_path)
+    with open(os.path.join(build_path, "marker.txt"), "w", encoding="utf-8") as f:
+        f.write(marker)
+    return build_path
+
+
+def read_marker(db_path):
+    with open(os.path.join(current_path(str(db_path)), "marker.txt"), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_first_use_creates_an_empty_version(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    path = current_path(str(tmp_path))
+    assert os.path.isdir(path)
+    assert current_version(str(tmp_path)) == os.path.basename(path)
+
+
+def test_legacy_database_is_moved_into_the_first_version(tmp_path):
+    (tmp_path / "chroma.sqlite3").write_text("legacy")
+
+    path = current_path(str(tmp_path))
+
+    assert open(os.path.join(path, "chroma.sqlite3"), encoding="utf-8").read() == "legacy"
+    assert not (tmp_path / "chroma.sqlite3").exists()
+
+
+def test_publish_switches_the_pointer(tmp_path):
+    build_path = build_version(tmp_path, "first")
+    assert build_path.endswith(BUILDING_SUFFIX)
+
+    name = publish_version(build_path, str(tmp_path))
+
+    assert current_version(str(tmp_path)) == name
+    assert not name.endswith(BUILDING_SUFFIX)
+    assert read_marker(tmp_path) == "first"
+    assert not any(entry.endswith(".tmp") for entry in os.listdir(tmp_path))
+
+
+def test_publish_prunes_old_versions(tmp_path):
+    names = [publish_version(build_version(tmp_path, str(i)), str(tmp_path)) for i in range(KEEP_VERSIONS + 2)]
+
+    remaining = sorted(os.listdir(versions_dir(str(tmp_path))))
+
+    assert remaining == names[-KEEP_VERSIONS:]
+    assert read_marker(tmp_path) == str(KEEP_VERSIONS + 1)
+
+
+def test_prune_keeps_unpublished_versions(tmp_path):
+    publish_version(build_version(tmp_path, "published"), str(tmp_path))
+    in_progress = build_version(tmp_path, "building")
+    finished = db_versions.finish_version(build_version(tmp_path, "finished"))
+
+    for _ in range(KEEP_VERSIONS + 1):
+        db_versions._prune(str(tmp_path))
+
+    assert os.path.isdir(in_progress)
+    assert os.path.isdir(finished)
+    assert read_marker(tmp_path) == "published"
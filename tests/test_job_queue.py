@@ -0,0 +1,145 @@
+import threading
+import time
+import pytest
+
+job_queue = pytest.importorskip("src.job_queue")
+from src.job_queue import (  # noqa: E402
+    STATUS_CANCELLED, STATUS_COMPLETED, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, IngestionJobQueue
+)
+
+
+class StubPipeline:
+    """Stands in for IngestionPipeline; records calls instead of embedding anything."""
+
+    ingested = []
+    # Set by a test to hold ingestion until released
+    gate = None
+    fail_on = None
+
+    def ingest_file(self, file_path, progress_callback=None, should_cancel=None, tenant=None, group=None):
+        if StubPipeline.gate is not None:
+            while not StubPipeline.gate.wait(0.01):
+                if should_cancel():
+                    raise job_queue.IngestionCancelled(file_path)
+        if file_path == StubPipeline.fail_on:
+            raise RuntimeError("parse error")
+        progress_callback(1, 1)
+        StubPipeline.ingested.append((file_path, tenant, group))
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "IngestionPipeline", StubPipeline)
+    monkeypatch.setattr(job_queue, "POLL_INTERVAL_SECONDS", 0.01)
+    StubPipeline.ingested = []
+    StubPipeline.gate = None
+    StubPipeline.fail_on = None
+    queue = IngestionJobQueue(db_path=str(tmp_path / "jobs.db"))
+    yield queue
+    queue.stop()
+
+
+def wait_for_status(queue, job_id, statuses, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get_job(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job stayed {queue.get_job(job_id)['status']}")
+
+
+def test_submitted_job_is_ingested(queue):
+    job_id = queue.submit(["a.pdf", "b.pdf"], tenant="acme")
+    assert queue.get_job(job_id)["status"] == STATUS_QUEUED
+
+    queue.start()
+    job = wait_for_status(queue, job_id, [STATUS_COMPLETED])
+
+    assert job["files_done"] == 2 and job["progress"] == 1.0
+    assert StubPipeline.ingested == [("a.pdf", "acme", None), ("b.pdf", "acme", None)]
+    assert queue.indexed_files() == ["a.pdf", "b.pdf"]
+    assert queue.indexed_files(tenant="acme") == ["a.pdf", "b.pdf"]
+    assert queue.indexed_files(tenant="globex") == []
+
+
+def test_failed_file_fails_the_job(queue):
+    StubPipeline.fail_on = "b.pdf"
+    job_id = queue.submit(["a.pdf", "b.pdf", "c.pdf"])
+
+    queue.start()
+    job = wait_for_status(queue, job_id, [STATUS_FAILED])
+
+    assert job["error"] == "parse error"
+    assert [f["status"] for f in job["files"]] == [STATUS_COMPLETED, STATUS_FAILED, STATUS_FAILED]
+    assert queue.indexed_files() == ["a.pdf"]
+
+
+def test_cancel_queued_job(queue):
+    job_id = queue.submit(["a.pdf"])
+
+    queue.cancel(job_id)
+    queue.start()
+    time.sleep(0.1)
+
+    assert queue.get_job(job_id)["status"] == STATUS_CANCELLED
+    assert StubPipeline.ingested == []
+
+
+def test_cancel_running_job(queue):
+    StubPipeline.gate = threading.Event()
+    job_id = queue.submit(["a.pdf", "b.pdf"])
+    queue.start()
+    wait_for_status(queue, job_id, [STATUS_RUNNING])
+
+    queue.cancel(job_id)
+    job = wait_for_status(queue, job_id, [STATUS_CANCELLED])
+
+    assert job["cancel_requested"]
+    assert StubPipeline.ingested == []
+
+
+def test_paused_holds_back_new_files(queue):
+    with queue.paused(timeout=1):
+        job_id = queue.submit(["a.pdf"])
+        queue.start()
+        time.sleep(0.1)
+        assert StubPipeline.ingested == []
+        assert queue.get_job(job_id)["files"][0]["status"] == STATUS_QUEUED
+
+    wait_for_status(queue, job_id, [STATUS_COMPLETED])
+    assert StubPipeline.ingested == [("a.pdf", None, None)]
+
+
+def test_paused_times_out_while_a_file_is_running(queue):
+    StubPipeline.gate = threading.Event()
+    job_id = queue.submit(["a.pdf"])
+    queue.start()
+    wait_for_status(queue, job_id, [STATUS_RUNNING])
+
+    with pytest.raises(TimeoutError):
+        with queue.paused(timeout=0.05):
+            pass
+    StubPipeline.gate.set()
+    wait_for_status(queue, job_id, [STATUS_COMPLETED])
+
+
+def test_restart_requeues_interrupted_jobs(queue):
+    StubPipeline.gate = threading.Event()
+    job_id = queue.submit(["a.pdf", "b.pdf"])
+    queue.start()
+    wait_for_status(queue, job_id, [STATUS_RUNNING])
+    # A stop leaves the job running, as a server shutdown would
+    queue.stop()
+    assert queue.get_job(job_id)["status"] == STATUS_RUNNING
+
+    StubPipeline.gate = None
+    restarted = IngestionJobQueue(db_path=queue.db_path)
+    restarted.start()
+    try:
+        job = wait_for_status(restarted, job_id, [STATUS_COMPLETED])
+    finally:
+        restarted.stop()
+
+    assert job["files_done"] == 2
+    assert StubPipeline.ingested == [("a.pdf", None, None), ("b.pdf", None, None)]
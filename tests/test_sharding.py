@@ -0,0 +1,92 @@
+from src.sharding import MAX_COLLECTION_NAME_LENGTH, SHARD_METADATA_KEY, ShardRouter
+
+
+class FakeCollection:
+    """Answers every query with fixed (id, distance) results."""
+
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+
+    def query(self, query_embeddings, n_results, where=None):
+        hits = self.results[:n_results]
+        return {
+            'ids': [[hit_id for hit_id, _ in hits] for _ in query_embeddings],
+            'distances': [[distance for _, distance in hits] for _ in query_embeddings],
+            'documents': [[f"text of {hit_id}" for hit_id, _ in hits] for _ in query_embeddings],
+            'metadatas': [[{'source': f"{hit_id}.pdf"} for hit_id, _ in hits] for _ in query_embeddings],
+        }
+
+
+class FakeClient:
+    def __init__(self, collections):
+        self.collections = collections
+
+    def list_collections(self):
+        return list(self.collections)
+
+
+def test_sanitized_keys_do_not_collide():
+    router = ShardRouter(None, base_name="documents", strategy="tenant")
+    names = {router.shard_name(key) for key in ["a b", "a-b", "a/b", "a.b", "a_b"]}
+    assert len(names) == 5
+    assert router.shard_name("a-b") == "documents__a-b"
+
+
+def test_long_keys_are_shortened_without_colliding():
+    router = ShardRouter(None, base_name="documents", strategy="tenant")
+    first = router.shard_name("x" * 100 + "1")
+    second = router.shard_name("x" * 100 + "2")
+    assert first != second
+    assert len(first) <= MAX_COLLECTION_NAME_LENGTH and len(second) <= MAX_COLLECTION_NAME_LENGTH
+
+
+def test_shard_for_strategies():
+    assert ShardRouter(None, "documents", strategy="single").shard_for("a.pdf") == "documents"
+    assert ShardRouter(None, "documents", strategy="tenant").shard_for("a.pdf", tenant="acme") == "documents__tenant-acme"
+    hashed = ShardRouter(None, "documents", strategy="hash", num_hash_shards=4)
+    assert hashed.shard_for("a.pdf") == hashed.shard_for("a.pdf")
+    assert {hashed.shard_for(f"{i}.pdf") for i in range(100)} <= {f"documents__hash-{i}" for i in range(4)}
+
+
+def test_query_merges_global_top_k_by_distance():
+    client = FakeClient([
+        FakeCollection("documents__hash-0", [("a", 0.1), ("b", 0.5), ("c", 0.9)]),
+        FakeCollection("documents__hash-1", [("d", 0.2), ("e", 0.3), ("f", 0.4)]),
+        FakeCollection("other", [("z", 0.0)]),
+    ])
+    router = ShardRouter(client, base_name="documents", strategy="hash")
+
+    [(ids, documents, metadatas)] = router.query([[0.0]], top_k=3)
+
+    assert ids == ["a", "d", "e"]
+    assert documents == ["text of a", "text of d", "text of e"]
+    assert [meta[SHARD_METADATA_KEY] for meta in metadatas] == [
+        "documents__hash-0", "documents__hash-1", "documents__hash-1"
+    ]
+
+
+def test_query_only_searches_the_given_shards():
+    client = FakeClient([
+        FakeCollection("documents__tenant-acme", [("a", 0.5)]),
+        FakeCollection("documents__tenant-globex", [("b", 0.1)]),
+    ])
+    router = ShardRouter(client, base_name="documents", strategy="tenant")
+
+    [(ids, _, _)] = router.query([[0.0]], top_k=5, shard_names=router.shard_names_for(tenant="acme"))
+
+    assert ids == ["a"]
+
+
+def test_overlapping_shards_skip_other_tenants():
+    client = FakeClient([
+        FakeCollection("documents", []),
+        FakeCollection("documents__hash-0", []),
+        FakeCollection("documents__tenant-acme", []),
+        FakeCollection("documents__tenant-globex", []),
+    ])
+    router = ShardRouter(client, base_name="documents", strategy="tenant")
+
+    overlapping = router.overlapping_shards("documents__tenant-acme")
+
+    assert [shard.name for shard in overlapping] == ["documents", "documents__hash-0"]
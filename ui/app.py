@@ -1,5 +1,6 @@
 import streamlit as st
 import os
+import json
 import time
 import sys
 
@@ -8,25 +9,91 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 # Now we can import from src
-from src.ingestion_pipeline import IngestionPipeline
+from src.job_queue import IngestionJobQueue
+from src.index_bundle import ensure_bundle, installed_manifest
+from src.profile_summarizer import ProfileSummarizer
 from src.rag_pipeline import RAGPipeline
-from src.chart_generator import is_json, create_chart
+from src.sharding import SHARD_STRATEGY
+from src.conversation_state import ConversationState
+from src.chart_generator import is_json, request_chart
 from clear_database import clear_database
 
 # --- Constants ---
 UPLOAD_DIR = "uploads"
+# Optional prebuilt index bundle to install at startup (see src/index_bundle.py)
+INDEX_BUNDLE_PATH = os.environ.get("INDEX_BUNDLE_PATH")
+# Summarize newly ingested documents in the background (loads a second LLM instance)
+BACKGROUND_SUMMARIES = True
+# How long "Clear All Documents" waits for running ingestion jobs to stop
+CLEAR_TIMEOUT_SECONDS = 60
+# How often a chart that is still rendering is checked for
+CHART_POLL_SECONDS = 0.5
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
+@st.cache_resource
+def install_index_bundle():
+    """Installs the configured index bundle once per server, unless it is already installed."""
+    if INDEX_BUNDLE_PATH:
+        ensure_bundle(INDEX_BUNDLE_PATH)
+    return True
+
+install_index_bundle()
+
+@st.cache_resource
+def get_job_queue():
+    """One background ingestion queue (and its workers) shared by all sessions."""
+    job_queue = IngestionJobQueue()
+    job_queue.start()
+    return job_queue
+
+job_queue = get_job_queue()
+
+@st.cache_resource
+def get_profile_summarizer():
+    """One background summarizer shared by all sessions."""
+    summarizer = ProfileSummarizer()
+    summarizer.start()
+    return summarizer
+
+if BACKGROUND_SUMMARIES:
+    get_profile_summarizer()
+
+def selected_scope():
+    """The tenant and document group chosen in the sidebar (None when the index is not sharded by them)."""
+    return st.session_state.get("tenant") or None, st.session_state.get("group") or None
+
+def selected_shard_names():
+    """The shards of the selected tenant or group, or None for all shards."""
+    tenant, group = selected_scope()
+    return st.session_state.rag_pipeline.shard_names_for(tenant=tenant, group=group)
+
+def list_indexed_files():
+    """Documents of the selected tenant or group: those from an installed index bundle, then the ones ingested here."""
+    tenant, group = selected_scope()
+    shard_names = selected_shard_names()
+    manifest = installed_manifest()
+    bundle_sources = []
+    if manifest:
+        for entry in manifest["collections"]:
+            if shard_names is None or entry["name"] in shard_names:
+                # Bundles exported before per-collection sources were recorded only list them all
+                bundle_sources.extend(entry.get("sources", manifest["sources"]))
+    return list(dict.fromkeys(bundle_sources + job_queue.indexed_files(tenant=tenant, group=group)))
+
 # --- Initialize session state (consolidated) ---
-if "ingestion_done" not in st.session_state:
-    st.session_state.ingestion_done = False
 if "rag_pipeline" not in st.session_state:
     st.session_state.rag_pipeline = RAGPipeline()
+if "indexed_files" not in st.session_state:
+    st.session_state.indexed_files = list_indexed_files()
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationState()
 if "processed_filename" not in st.session_state:
-    st.session_state.processed_filename = None
+    st.session_state.processed_filename = (
+        st.session_state.indexed_files[-1] if st.session_state.indexed_files else None
+    )
 
 # Set the page configuration
 st.set_page_config(
@@ -51,36 +118,26 @@ def handle_query(prompt):
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
             rag_pipe = st.session_state.rag_pipeline
-            
-            # Format chat history for the backend
-            chat_history_for_backend = []
-            for i, msg in enumerate(st.session_state.messages[:-1]):  # Exclude current question
-                if msg["role"] == "user":
-                    # Find the next assistant response
-                    for j in range(i + 1, len(st.session_state.messages)):
-                        if st.session_state.messages[j]["role"] == "assistant":
-                            chat_history_for_backend.append((msg["content"], st.session_state.messages[j]["content"]))
-                            break
-
-            # Call the backend - the response might be text or JSON
+
+            # Call the backend - the response might be text or JSON.
+            # The conversation state records the turn and rewrites follow-ups.
+            # With tenant/group sharding, only the selected shard is searched
             response, sources, next_steps = rag_pipe.generate_answer(
                 query=prompt, 
-                chat_history=chat_history_for_backend
+                conversation=st.session_state.conversation,
+                shard_names=selected_shard_names()
             )
             
             # Check if the response is a chart or text
             is_chart_json, json_str = is_json(response)
             if is_chart_json:
                 st.markdown("It looks like a chart is the best way to answer this. Generating visualization...")
-                fig, err = create_chart(json_str)
-                if err:
-                    st.error(err)
-                    # Show the raw JSON for debugging
-                    st.code(json_str, language="json")
-                else:
-                    st.pyplot(fig)
-                # Add a text confirmation to the chat history
-                st.session_state.messages.append({"role": "assistant", "content": "[Chart generated above]"})
+                # Rendering runs in the background; the chat history shows the chart once it is ready
+                chart_result = request_chart(json_str)
+                if chart_result is None or chart_result[1] is None:
+                    st.session_state.conversation.attach_chart(json.loads(json_str))
+                # Keep the chart spec so the chart can be drawn (and redrawn) with the history
+                st.session_state.messages.append({"role": "assistant", "content": "[Chart generated above]", "chart": json_str})
             else:
                 # It's a regular text answer
                 st.markdown(response)
@@ -112,53 +169,112 @@ def handle_query(prompt):
                             st.session_state.follow_up_question = clean_question
                             st.rerun()
 
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating..."
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
+
+@st.fragment(run_every=CHART_POLL_SECONDS)
+def chart_placeholder(chart_json):
+    """Stands in for a chart that is still rendering and refreshes the page once it is done."""
+    if request_chart(chart_json) is None:
+        st.caption("Rendering chart...")
+    else:
+        st.rerun(scope="app")
+
+@st.fragment(run_every=1.0)
+def render_ingestion_jobs():
+    """Polls the job queue and shows per-file and per-chunk progress for active jobs."""
+    for job in job_queue.list_jobs(active_only=True):
+        st.markdown(
+            f"**Job {job['id'][:8]}** - {job['status']} "
+            f"({job['files_done']}/{job['files_total']} files, ETA {format_eta(job['eta_seconds'])})"
+        )
+        for f in job["files"]:
+            if f["chunks_total"]:
+                label = f"{f['file_name']}: {f['chunks_done']}/{f['chunks_total']} chunks"
+            else:
+                label = f"{f['file_name']}: {f['status']}"
+            st.progress(f["fraction"], text=label)
+        if not job["cancel_requested"]:
+            if st.button("Cancel", key=f"cancel_{job['id']}"):
+                job_queue.cancel(job["id"])
+        else:
+            st.caption("Cancelling...")
+
+    # Refresh the whole page once new documents become queryable
+    indexed_files = list_indexed_files()
+    if indexed_files != st.session_state.indexed_files:
+        st.session_state.indexed_files = indexed_files
+        if st.session_state.processed_filename not in indexed_files:
+            st.session_state.processed_filename = indexed_files[-1] if indexed_files else None
+        st.rerun(scope="app")
+
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("1. Upload & Process")
+
+    # Documents and questions are scoped to a tenant or document group when the index is sharded by one
+    if SHARD_STRATEGY == "tenant":
+        st.text_input("Tenant", key="tenant")
+    elif SHARD_STRATEGY == "group":
+        st.text_input("Document group", key="group")
     
     # File uploader widget
-    uploaded_file = st.file_uploader(
-        "Upload a CSV, PDF, DOCX, or TXT file",
+    uploaded_files = st.file_uploader(
+        "Upload CSV, PDF, DOCX, or TXT files",
         type=['csv', 'pdf', 'docx', 'txt'],
+        accept_multiple_files=True,
         label_visibility="collapsed"
     )
     
-    if uploaded_file is not None:
-        # Check if this file has already been processed
-        if not st.session_state.ingestion_done:
-            st.info("File detected. Click 'Process Document' to begin.")
-
-            if st.button("Process Document"):
-                # 1. Clear any previous database
-                with st.spinner("Clearing old data..."):
-                    clear_database()
-                
-                # 2. Save the file to a local directory
+    if uploaded_files:
+        st.info("Click 'Process Documents' to index them in the background.")
+
+        if st.button("Process Documents"):
+            # 1. Save the files to a local directory
+            file_paths = []
+            for uploaded_file in uploaded_files:
                 file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
                 with open(file_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
-                
-                # 3. Run the ingestion pipeline
-                with st.spinner(f"Processing `{uploaded_file.name}`... This may take a moment."):
-                    ingestion_pipe = IngestionPipeline()
-                    ingestion_pipe.ingest_file(file_path)
-                
-                # 4. Update session state
-                st.session_state.ingestion_done = True
-                st.session_state.processed_filename = uploaded_file.name
-                st.success("Document processed successfully!")
-                # Force a rerun to update the main interface
-                st.rerun()
+                file_paths.append(file_path)
+
+            # 2. Queue the ingestion; the workers pick it up in the background
+            tenant, group = selected_scope()
+            job_queue.submit(file_paths, tenant=tenant, group=group)
+            st.success(f"Queued {len(file_paths)} document(s) for processing.")
+
+    render_ingestion_jobs()
 
     # Add a "New Chat" button to reset
-    if st.session_state.ingestion_done:
-        if st.button("Start New Chat / Upload New File"):
-            st.session_state.ingestion_done = False
+    if st.session_state.messages:
+        if st.button("Start New Chat"):
             st.session_state.messages = []
-            st.session_state.processed_filename = None
+            st.session_state.conversation = ConversationState()
             if "follow_up_question" in st.session_state:
                 del st.session_state.follow_up_question
+            st.rerun()
+
+    if st.session_state.indexed_files:
+        if st.button("Clear All Documents"):
+            job_queue.cancel_all()
+            # Running jobs stop after their current batch; clear only once no worker is writing
+            with st.spinner("Stopping running ingestion jobs..."):
+                stopped = job_queue.wait_until_idle(timeout=CLEAR_TIMEOUT_SECONDS)
+            if not stopped:
+                st.error("Ingestion jobs are still running. Please try again in a moment.")
+                st.stop()
             clear_database()
+            job_queue.clear_history()
+            st.session_state.indexed_files = []
+            st.session_state.processed_filename = None
+            st.session_state.messages = []
+            st.session_state.conversation = ConversationState()
+            st.session_state.rag_pipeline = RAGPipeline()
+            if "follow_up_question" in st.session_state:
+                del st.session_state.follow_up_question
             st.rerun()
 
     st.header("2. Configure")
@@ -167,8 +283,14 @@ with st.sidebar:
 # --- MAIN CHAT INTERFACE ---
 st.header("Ask Your Data")
 
-if st.session_state.ingestion_done:
-    st.info(f"Ready to answer questions about `{st.session_state.processed_filename}`")
+if st.session_state.indexed_files:
+    st.info(f"Ready to answer questions about {len(st.session_state.indexed_files)} indexed document(s).")
+    st.session_state.processed_filename = st.selectbox(
+        "Document to summarize",
+        st.session_state.indexed_files,
+        index=st.session_state.indexed_files.index(st.session_state.processed_filename)
+        if st.session_state.processed_filename in st.session_state.indexed_files else 0
+    )
     
     # Handle follow-up questions from button clicks
     if "follow_up_question" in st.session_state:
@@ -186,7 +308,11 @@ if st.session_state.ingestion_done:
         rag_pipe = st.session_state.rag_pipeline
         with st.chat_message("assistant"):
             with st.spinner("Generating summary..."):
-                summary = rag_pipe.summarize_document(st.session_state.processed_filename)
+                summary = rag_pipe.summarize_document(
+                    st.session_state.processed_filename,
+                    generate_if_missing=not BACKGROUND_SUMMARIES,
+                    shard_names=selected_shard_names()
+                )
                 st.markdown(summary)
                 # Add the summary to the message history
                 st.session_state.messages.append({"role": "assistant", "content": summary})
@@ -195,6 +321,20 @@ if st.session_state.ingestion_done:
     # Display existing chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
+            if message.get("chart"):
+                # Served from the chart cache once rendered; never rendered on the script thread
+                chart_result = request_chart(message["chart"])
+                if chart_result is None:
+                    chart_placeholder(message["chart"])
+                else:
+                    image, err = chart_result
+                    if err:
+                        st.error(err)
+                        # Show the raw JSON for debugging
+                        st.code(message["chart"], language="json")
+                    else:
+                        st.image(image)
+                continue
             st.markdown(message["content"])
 
     # Chat input widget at the bottom
@@ -203,4 +343,4 @@ if st.session_state.ingestion_done:
         st.rerun()
 
 else:
-    st.info("Please upload and process a document to get started.")
\ No newline at end of file
+    st.info("Please upload and process a document to get started. You can ask questions as soon as the first one is indexed.")
\ No newline at end of file